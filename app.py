@@ -8,9 +8,7 @@ import graphviz
 from pathlib import Path
 import time
 import shutil
-import hashlib
 from datetime import datetime
-import zipfile
 
 # --- AJUSTE DE SEGURIDAD CRÍTICO ---
 if "OPENAI_API_KEY" in st.secrets:
@@ -29,6 +27,11 @@ DATA_PATH = ROOT_DIR / "data" / "samples"
 OUTPUT_PATH = ROOT_DIR 
 KB_PATH = ROOT_DIR / "rag" / "knowledge_base"
 
+# Hashing y árbol de Merkle compartidos con los scripts del pipeline
+sys.path.append(str(ROOT_DIR / "scripts"))
+from merkle import HASH_CACHE_FILE, file_digests, merkle_root_from_hashes
+from audit_zip import write_audit_zip
+
 # --- DATOS DE RESPALDO (VISUALIZACIÓN) ---
 MOCK_DATA = {
     "narrative": "El análisis del crédito 'Amazonia Restoration #001' (150ha) revela una alineación parcial con la taxonomía de la UE. Si bien la metodología de 'restauración activa' es válida según el Reglamento 2024/1991, el reporte carece de métricas de permanencia a largo plazo exigidas por la Hoja de Ruta de Créditos de Naturaleza (2025). Se identifica un riesgo financiero medio asociado a la posible revocación del crédito.",
@@ -50,14 +53,6 @@ MOCK_DATA = {
 
 # --- MOTOR DE AUDITORÍA FORENSE (STEELTRACE CORE) ---
 
-def calculate_file_hash(filepath):
-    """Calcula SHA-256 de un archivo físico."""
-    hasher = hashlib.sha256()
-    with open(filepath, 'rb') as f:
-        buf = f.read()
-        hasher.update(buf)
-    return hasher.hexdigest()
-
 def generate_secure_package():
     """Genera el paquete de auditoría con integridad criptográfica."""
     
@@ -89,20 +84,20 @@ def generate_secure_package():
     # 3. Construir Manifiesto de Integridad
     manifest_entries = []
     hash_list = []
+    sealed = {name: path for name, path in artifacts.items() if path.exists()}
+    digests = file_digests(list(sealed.values()), ROOT_DIR / HASH_CACHE_FILE)
     
-    for name, path in artifacts.items():
-        if path.exists():
-            f_hash = calculate_file_hash(path)
-            hash_list.append(f_hash)
-            manifest_entries.append({
-                "file": name,
-                "sha256": f_hash,
-                "timestamp": datetime.utcnow().isoformat() + "Z"
-            })
+    for name, path in sealed.items():
+        f_hash = digests[str(path)]
+        hash_list.append(f_hash)
+        manifest_entries.append({
+            "file": name,
+            "sha256": f_hash,
+            "timestamp": datetime.utcnow().isoformat() + "Z"
+        })
     
-    # Calcular Merkle Root (Hash de los hashes)
-    combined_hash = "".join(sorted(hash_list))
-    merkle_root = hashlib.sha256(combined_hash.encode('utf-8')).hexdigest()
+    # Calcular Merkle Root (mismo árbol por pares que scripts/merkle.py)
+    merkle_root = merkle_root_from_hashes(hash_list)
     
     manifest_data = {
         "run_id": f"GICES-{int(time.time())}",
@@ -120,11 +115,13 @@ def generate_secure_package():
     zip_name = f"GICES_AUDIT_{manifest_data['run_id']}.zip"
     zip_path = audit_dir / zip_name
     
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for name, path in artifacts.items():
-            if path.exists():
-                zipf.write(path, arcname=name)
-        zipf.write(manifest_path, arcname="evidence_manifest.json")
+    # Compresión en paralelo; los hashes leídos al empaquetar deben coincidir con los sellados
+    members = [(path, name) for name, path in sealed.items()]
+    packed = write_audit_zip(zip_path, members + [(manifest_path, "evidence_manifest.json")])
+    for name, path in sealed.items():
+        if packed[str(path)]["sha256"] != digests[str(path)]:
+            zip_path.unlink(missing_ok=True)
+            raise RuntimeError(f"{name} cambió entre el sellado y el empaquetado")
         
     return zip_path
 
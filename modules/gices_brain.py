@@ -1,47 +1,116 @@
 import os
 import json
+import time
+import random
+import threading
 import fitz  # PyMuPDF
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+from openai import OpenAI, RateLimitError, APIConnectionError, InternalServerError
 from pathlib import Path
+from modules.knowledge_index import search
 
 # Configuración del Cliente OpenAI
-# Intenta obtener la clave de las variables de entorno o secretos de Streamlit
+# Intenta obtener la clave de las variables de entorno o secretos de Streamlit.
+# OPENAI_BASE_URL permite apuntar a un servidor local (p. ej. scripts/openai_stub.py).
+# Los reintentos (429, conexión/timeout y 5xx) se hacen en _complete, no en el cliente,
+# para que un 429 no se reintente dos veces con esperas distintas.
 api_key = os.environ.get("OPENAI_API_KEY")
-client = OpenAI(api_key=api_key) if api_key else None
+client = OpenAI(api_key=api_key, max_retries=0) if api_key else None
 
 # --- 1. CAPACIDAD VISUAL (Leer PDFs) ---
-def ingest_pdfs(pdf_dir):
+# Páginas por tarea en modo paralelo: los PDFs grandes se reparten entre varios procesos
+PAGES_PER_TASK = 32
+
+def extract_pdf(f, first=0, last=None):
+    """Extrae los fragmentos (una página = un fragmento) de un PDF, opcionalmente de un rango de páginas."""
+    f = Path(f)
+    chunks = []
+    doc = fitz.open(f)
+    last = doc.page_count if last is None else min(last, doc.page_count)
+    for i in range(first, last):
+        text = doc[i].get_text().replace("\n", " ").strip()
+        # Solo guardamos párrafos con contenido sustancial
+        if len(text) > 100:
+            # Guardamos metadatos clave para la cita académica
+            chunks.append({
+                "source": f.name,
+                "page": i + 1,
+                "content": text
+            })
+    return chunks
+
+def _extract_task(task):
+    # Se ejecuta en un proceso del pool: no propaga excepciones, las devuelve
+    f, first, last = task
+    try:
+        return extract_pdf(f, first, last), None
+    except Exception as e:
+        return [], str(e)
+
+def extract_pdfs(files, workers=1, pages_per_task=PAGES_PER_TASK):
+    """Extrae varios PDFs; con workers > 1 usa un pool de procesos por rangos de páginas.
+
+    Devuelve {ruta: fragmentos} respetando el orden (documento, página) de entrada,
+    de modo que el índice resultante es reproducible con cualquier número de workers.
+    """
+    files = [Path(f) for f in files]
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    tasks = []
+    for f in files:
+        if workers <= 1:
+            tasks.append((f, 0, None))
+            continue
+        try:
+            n_pages = fitz.open(f).page_count
+        except Exception as e:
+            print(f"⚠️ Error leyendo {f.name}: {e}")
+            continue
+        tasks.extend((f, p, p + pages_per_task) for p in range(0, max(1, n_pages), pages_per_task))
+
+    if workers <= 1 or len(tasks) <= 1:
+        results = map(_extract_task, tasks)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_extract_task, tasks))
+
+    out, failed = {}, set()
+    for (f, _, _), (chunks, err) in zip(tasks, results):
+        if f in failed:
+            continue
+        if err:
+            print(f"⚠️ Error leyendo {f.name}: {err}")
+            failed.add(f)
+            out.pop(f, None)
+            continue
+        out.setdefault(f, []).extend(chunks)
+    return out
+
+def ingest_pdfs(pdf_dir, workers=1):
     """Convierte PDFs académicos en fragmentos de texto procesables."""
-    knowledge = []
     pdf_path = Path(pdf_dir)
     
     if not pdf_path.exists():
         return []
     
     print(f"📂 Leyendo PDFs desde: {pdf_path}")
-    for f in pdf_path.glob("*.pdf"):
-        try:
-            doc = fitz.open(f)
-            for i, page in enumerate(doc):
-                text = page.get_text().replace("\n", " ").strip()
-                # Solo guardamos párrafos con contenido sustancial
-                if len(text) > 100:
-                    # Guardamos metadatos clave para la cita académica
-                    knowledge.append({
-                        "source": f.name,
-                        "page": i + 1,
-                        "content": text
-                    })
-        except Exception as e:
-            print(f"⚠️ Error leyendo {f.name}: {e}")
-            
-    return knowledge
+    extracted = extract_pdfs(sorted(pdf_path.glob("*.pdf")), workers=workers)
+    return [c for chunks in extracted.values() for c in chunks]
+
+def retrieve_context(query, knowledge_base, k=4, index=None):
+    """Busca los fragmentos más relevantes en la base de conocimiento.
 
-def retrieve_context(query, knowledge_base, k=4):
-    """Busca los fragmentos más relevantes en la base de conocimiento."""
+    Si se pasa un índice BM25 (modules.knowledge_index) solo se recorren los
+    postings de los términos de la query; sin índice se hace el barrido lineal.
+    """
     if not knowledge_base:
         return []
-        
+
+    if index is not None:
+        return [knowledge_base[doc_id] for doc_id, _ in search(index, query, k)]
+
     scored = []
     query_terms = set(query.lower().split())
     
@@ -57,27 +126,19 @@ def retrieve_context(query, knowledge_base, k=4):
     return [s[1] for s in scored[:k]]
 
 # --- 2. CAPACIDAD DE RAZONAMIENTO (Motor Deliberativo) ---
-def deliberative_analysis(data_point, context_chunks, mode="Academic Validation"):
-    """Genera el Acta de Razonamiento comparando el dato con la norma."""
-    
-    if not client:
-        return {
-            "narrative": "Error: No se detectó OPENAI_API_KEY. Configura los secretos.",
-            "compliance_check": "ERROR",
-            "citations": []
-        }
+MODEL = "gpt-4o"  # O gpt-3.5-turbo si prefieres
+MAX_RETRIES = 6   # reintentos ante 429 (rate limit) con backoff exponencial
+MAX_TRANSIENT_RETRIES = 2  # conexión, timeout y 5xx: los mismos que el cliente OpenAI por defecto
+MAX_RETRY_WAIT = 60.0      # segundos máximos de espera entre reintentos, también con Retry-After
 
-    # Formatear la evidencia para que la IA la lea
-    evidence_str = "\n\n".join([f"- [Fuente: {c['source']} Pág.{c['page']}] {c['content'][:600]}..." for c in context_chunks])
-    
-    prompt = f"""
+PROMPT_TEMPLATE = """
     Actúa como un investigador experto en {mode} (CSRD/ESRS).
     
     OBJETIVO: Validar la integridad ética y jurídica del siguiente dato reportado.
-    DATO: {json.dumps(data_point)}
+    DATO: {data}
     
     EVIDENCIA NORMATIVA (Debes basarte EXCLUSIVAMENTE en esto):
-    {evidence_str}
+    {evidence}
     
     INSTRUCCIONES:
     1. Analiza si el proyecto cumple con los criterios de "Alta Integridad" o "Restauración".
@@ -92,14 +153,99 @@ def deliberative_analysis(data_point, context_chunks, mode="Academic Validation"
         "key_risk": "El riesgo principal detectado"
     }}
     """
+
+def build_prompt(data_point, context_chunks, mode="Academic Validation"):
+    # Formatear la evidencia para que la IA la lea
+    evidence_str = "\n\n".join([f"- [Fuente: {c['source']} Pág.{c['page']}] {c['content'][:600]}..." for c in context_chunks])
+    return PROMPT_TEMPLATE.format(mode=mode, data=json.dumps(data_point), evidence=evidence_str)
+
+def estimate_tokens(prompt, completion_tokens=500):
+    """Estimación barata (~4 caracteres por token) para el presupuesto de tokens/minuto."""
+    return len(prompt) // 4 + completion_tokens
+
+class TokenBudget:
+    """Cubo de tokens compartido entre hilos: limita el consumo a `tpm` tokens por minuto."""
+
+    def __init__(self, tpm):
+        self.capacity = float(tpm)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, n):
+        n = min(float(n), self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                wait = (n - self.tokens) / self.rate
+            time.sleep(wait)
+
+def _retry_after(err, attempt):
+    # Respeta la cabecera Retry-After si el servidor la envía (acotada: un valor enorme no debe
+    # bloquear el hilo); si no, backoff exponencial con jitter
+    try:
+        return min(MAX_RETRY_WAIT, max(0.0, float(err.response.headers.get("retry-after"))))
+    except Exception:
+        return min(MAX_RETRY_WAIT, 2 ** attempt) * (0.5 + random.random() / 2)
+
+def _complete(prompt, budget=None):
+    # Cada intento consume tokens del presupuesto: un reintento es otra petición para el límite TPM
+    tokens = estimate_tokens(prompt)
+    transient = 0
+    for attempt in range(MAX_RETRIES + 1):
+        if budget is not None:
+            budget.acquire(tokens)
+        try:
+            return client.chat.completions.create(
+                model=MODEL,
+                messages=[{"role": "system", "content": prompt}],
+                response_format={"type": "json_object"},
+                temperature=0.2 # Bajo para ser riguroso
+            )
+        except RateLimitError as e:
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(_retry_after(e, attempt))
+        except (APIConnectionError, InternalServerError) as e:  # APITimeoutError hereda de APIConnectionError
+            if transient == MAX_TRANSIENT_RETRIES or attempt == MAX_RETRIES:
+                raise
+            time.sleep(_retry_after(e, transient))
+            transient += 1
+
+def deliberative_analysis(data_point, context_chunks, mode="Academic Validation", budget=None):
+    """Genera el Acta de Razonamiento comparando el dato con la norma."""
+    
+    if not client:
+        return {
+            "narrative": "Error: No se detectó OPENAI_API_KEY. Configura los secretos.",
+            "compliance_check": "ERROR",
+            "citations": []
+        }
+
+    prompt = build_prompt(data_point, context_chunks, mode)
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o", # O gpt-3.5-turbo si prefieres
-            messages=[{"role": "system", "content": prompt}],
-            response_format={"type": "json_object"},
-            temperature=0.2 # Bajo para ser riguroso
-        )
+        response = _complete(prompt, budget)
         return json.loads(response.choices[0].message.content)
     except Exception as e:
         return {"narrative": f"Error en deliberación: {e}", "compliance_check": "FAIL"}
+
+def deliberate_batch(items, concurrency=1, tpm=None, mode="Academic Validation"):
+    """Delibera una lista de (dato, evidencias) con `concurrency` hilos y un presupuesto opcional de tokens/minuto.
+
+    El resultado conserva el orden de `items`, independientemente del orden de finalización.
+    """
+    budget = TokenBudget(tpm) if tpm else None
+    def run(item):
+        data_point, context_chunks = item
+        return deliberative_analysis(data_point, context_chunks, mode, budget=budget)
+    if concurrency <= 1:
+        return [run(it) for it in items]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(run, items))
@@ -0,0 +1,124 @@
+import os
+import json
+import math
+import re
+import heapq
+from array import array
+from collections import Counter
+from pathlib import Path
+
+# Base de conocimiento en JSONL (un fragmento por línea) + sidecar de offsets,
+# e índice invertido BM25 sobre esos fragmentos. El índice se construye una vez
+# en la ingesta y en consulta solo se recorren los postings de los términos de
+# la query; el texto de cada fragmento se lee bajo demanda con un seek.
+
+K1 = 1.5
+B = 0.75
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+def offsets_path(path: str | Path) -> Path:
+    return Path(str(path) + ".offsets")
+
+def write_chunks(chunks, path: str | Path) -> int:
+    """Escribe los fragmentos en streaming a JSONL y el sidecar de offsets (uint64 por línea)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    offsets = array("Q")
+    with open(tmp, "wb") as f:
+        for chunk in chunks:
+            offsets.append(f.tell())
+            f.write(json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n")
+    with open(offsets_path(tmp), "wb") as f:
+        offsets.tofile(f)
+    # Se reemplaza al final: el fichero anterior puede estar leyéndose como origen
+    os.replace(offsets_path(tmp), offsets_path(path))
+    os.replace(tmp, path)
+    return len(offsets)
+
+class ChunkStore:
+    """Acceso perezoso a los fragmentos de un JSONL: solo se cargan los offsets en memoria."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.offsets = array("Q")
+        with open(offsets_path(self.path), "rb") as f:
+            self.offsets.frombytes(f.read())
+        self._fh = open(self.path, "rb")
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i: int) -> dict:
+        self._fh.seek(self.offsets[i])
+        return json.loads(self._fh.readline())
+
+    def __iter__(self):
+        with open(self.path, "rb") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def close(self):
+        self._fh.close()
+
+def open_chunks(path: str | Path) -> ChunkStore | None:
+    p = Path(path)
+    if not (p.exists() and offsets_path(p).exists()):
+        return None
+    return ChunkStore(p)
+
+def tokenize(text: str) -> list[str]:
+    """Normaliza a minúsculas y separa en palabras (descarta tokens de 1 carácter)."""
+    return [t for t in TOKEN_RE.findall(text.lower()) if len(t) > 1]
+
+def build_index(chunks, k1: float = K1, b: float = B) -> dict:
+    """Construye el índice BM25 recorriendo los fragmentos una vez; doc_id = posición en la base."""
+    postings: dict[str, tuple[list[int], list[int]]] = {}
+    doc_len = []
+    for doc_id, chunk in enumerate(chunks):
+        tf = Counter(tokenize(chunk["content"]))
+        doc_len.append(sum(tf.values()))
+        for term, freq in tf.items():
+            docs, freqs = postings.setdefault(term, ([], []))
+            docs.append(doc_id)
+            freqs.append(freq)
+    n_docs = len(doc_len)
+    return {
+        "version": 1,
+        "k1": k1,
+        "b": b,
+        "n_docs": n_docs,
+        "avgdl": (sum(doc_len) / n_docs) if n_docs else 0.0,
+        "doc_len": doc_len,
+        "postings": {t: [d, f] for t, (d, f) in postings.items()}
+    }
+
+def save_index(index: dict, path: str | Path) -> None:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    Path(path).write_text(json.dumps(index, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+
+def load_index(path: str | Path) -> dict | None:
+    p = Path(path)
+    if not p.exists():
+        return None
+    return json.loads(p.read_text(encoding="utf-8"))
+
+def search(index: dict, query: str, k: int = 4) -> list[tuple[int, float]]:
+    """Devuelve [(doc_id, score)] de los k mejores fragmentos según BM25."""
+    n_docs = index["n_docs"]
+    if not n_docs:
+        return []
+    k1, b, avgdl = index["k1"], index["b"], index["avgdl"] or 1.0
+    doc_len = index["doc_len"]
+    scores: dict[int, float] = {}
+    for term in set(tokenize(query)):
+        plist = index["postings"].get(term)
+        if not plist:
+            continue
+        docs, freqs = plist
+        idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+        for doc_id, tf in zip(docs, freqs):
+            norm = k1 * (1 - b + b * doc_len[doc_id] / avgdl)
+            scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+    # Desempate por doc_id para que el resultado sea reproducible
+    return heapq.nlargest(k, scores.items(), key=lambda x: (x[1], -x[0]))
@@ -0,0 +1,227 @@
+import hashlib, os, shutil, struct, tempfile, time, zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from utils_hash import HASH_BUFFER
+from merkle import stat_key
+
+# Empaquetado ZIP de auditoría en paralelo. Cada miembro se lee una sola vez:
+# en esa lectura se calcula su SHA-256 y su CRC-32 y se comprime (deflate crudo)
+# en un hilo del pool; zlib y hashlib liberan el GIL, así que el tiempo escala
+# con los núcleos. El hilo principal ensambla el ZIP en orden con ZipWriter.
+# Los ficheros ya comprimidos se guardan sin recomprimir (método stored).
+# Memoria acotada: cada comprimido vive en un SpooledTemporaryFile que pasa a
+# disco al superar SPOOL_MAX, y solo hay 2×workers miembros en vuelo.
+
+SPOOL_MAX = 8 << 20  # bytes de comprimido por miembro que se mantienen en memoria
+COMPRESS_LEVEL = 6   # el nivel por defecto de zlib/zipfile
+PRECOMPRESSED = {".gz", ".tgz", ".zip", ".bz2", ".xz", ".zst", ".7z",
+                 ".png", ".jpg", ".jpeg", ".gif", ".webp", ".mp4"}
+
+def is_precompressed(path: str | Path) -> bool:
+    return Path(path).suffix.lower() in PRECOMPRESSED
+
+def _check_unchanged(path: str | Path, before: list[int]) -> None:
+    if stat_key(path) != before:
+        raise RuntimeError(f"{path} cambió mientras se empaquetaba")
+
+def _deflate_member(path: str, level: int) -> dict:
+    """Lee `path` una vez: SHA-256, CRC-32 y deflate crudo a un spool temporal."""
+    before = stat_key(path)
+    sha, crc, size = hashlib.sha256(), 0, 0
+    comp = zlib.compressobj(level, zlib.DEFLATED, -15)
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX)
+    buf = bytearray(HASH_BUFFER)
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
+        while n := f.readinto(buf):
+            chunk = view[:n]
+            sha.update(chunk)
+            crc = zlib.crc32(chunk, crc)
+            spool.write(comp.compress(chunk))
+            size += n
+    spool.write(comp.flush())
+    _check_unchanged(path, before)
+    return {"sha256": sha.hexdigest(), "crc": crc, "size": size, "stat": before, "spool": spool}
+
+# -------- Escritor ZIP (APPNOTE 6.3, con ZIP64) --------
+# zipfile no permite añadir un miembro ya comprimido sin usar sus atributos
+# internos, así que las cabeceras locales, el directorio central y los registros
+# ZIP64 se escriben aquí; zipfile solo se usa para leer (tests de ida y vuelta).
+
+STORED, DEFLATED = 0, 8
+ZIP64_LIMIT = 0xFFFFFFFF  # a partir de aquí el campo de 32 bits lleva ZIP64_MARK y el valor va en ZIP64
+ZIP64_MARK = 0xFFFFFFFF
+_LOCAL = struct.Struct("<IHHHHHIIIHH")
+_CENTRAL = struct.Struct("<IHHHHHHIIIHHHHHII")
+_END64 = struct.Struct("<IQHHIIQQQQ")
+_LOCATOR64 = struct.Struct("<IIQI")
+_END = struct.Struct("<IHHHHIIH")
+_MADE_BY = 3 << 8  # Unix: los permisos van en los 16 bits altos de external_attr
+
+def _clamp(v: int) -> int:
+    return ZIP64_MARK if v >= ZIP64_LIMIT else v
+
+def _dos_datetime(mtime: float) -> tuple[int, int]:
+    t = time.localtime(mtime)
+    if t.tm_year < 1980:  # el formato DOS empieza en 1980
+        return 0, (0 << 9) | (1 << 5) | 1
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), \
+           ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+class ZipWriter:
+    """ZIP secuencial sobre un fichero con seek. No es thread-safe: solo lo usa el hilo que ensambla."""
+
+    def __init__(self, path: str | Path):
+        self.fp = open(path, "wb")
+        self.entries = []
+        self.names = set()
+
+    def _header(self, arcname: str, method: int, crc: int, csize: int, usize: int,
+                mtime: float, mode: int) -> dict:
+        if arcname in self.names:
+            raise ValueError(f"miembro duplicado en el ZIP: {arcname}")
+        self.names.add(arcname)
+        try:
+            name, flags = arcname.encode("ascii"), 0
+        except UnicodeEncodeError:
+            name, flags = arcname.encode("utf-8"), 0x800  # bit 11: nombre en UTF-8
+        zip64 = usize >= ZIP64_LIMIT or csize >= ZIP64_LIMIT
+        extra = struct.pack("<HHQQ", 1, 16, usize, csize) if zip64 else b""
+        dostime, dosdate = _dos_datetime(mtime)
+        e = {"name": name, "flags": flags, "method": method, "time": dostime, "date": dosdate,
+             "crc": crc, "csize": csize, "usize": usize, "offset": self.fp.tell(),
+             "attr": (mode & 0xFFFF) << 16, "version": 45 if zip64 else 20}
+        self.fp.write(_LOCAL.pack(0x04034B50, e["version"], flags, method, dostime, dosdate, crc,
+                                  ZIP64_MARK if zip64 else csize, ZIP64_MARK if zip64 else usize,
+                                  len(name), len(extra)) + name + extra)
+        self.entries.append(e)
+        return e
+
+    def add_compressed(self, arcname: str, src, crc: int, csize: int, usize: int,
+                       mtime: float, mode: int = 0o100644) -> None:
+        """Miembro deflate ya comprimido: se copia `src` (csize bytes) tras la cabecera."""
+        self._header(arcname, DEFLATED, crc, csize, usize, mtime, mode)
+        shutil.copyfileobj(src, self.fp, HASH_BUFFER)
+
+    def add_stored(self, arcname: str, f, size: int, mtime: float, mode: int = 0o100644) -> str:
+        """Copia `size` bytes de `f` sin comprimir; CRC y SHA-256 en la misma lectura. Devuelve el SHA-256."""
+        e = self._header(arcname, STORED, 0, size, size, mtime, mode)
+        sha, crc, n_read = hashlib.sha256(), 0, 0
+        buf = bytearray(HASH_BUFFER)
+        view = memoryview(buf)
+        while n := f.readinto(buf):
+            chunk = view[:n]
+            sha.update(chunk)
+            crc = zlib.crc32(chunk, crc)
+            self.fp.write(chunk)
+            n_read += n
+        if n_read != size:
+            raise RuntimeError(f"{arcname}: se leyeron {n_read} bytes, se esperaban {size}")
+        e["crc"] = crc
+        end = self.fp.tell()
+        self.fp.seek(e["offset"] + 14)  # campo CRC-32 de la cabecera local
+        self.fp.write(struct.pack("<I", crc))
+        self.fp.seek(end)
+        return sha.hexdigest()
+
+    def writestr(self, arcname: str, data: str | bytes, level: int = 6) -> None:
+        data = data.encode("utf-8") if isinstance(data, str) else data
+        comp = zlib.compressobj(level, zlib.DEFLATED, -15)
+        body = comp.compress(data) + comp.flush()
+        self._header(arcname, DEFLATED, zlib.crc32(data), len(body), len(data), time.time(), 0o100644)
+        self.fp.write(body)
+
+    def close(self) -> None:
+        cd_offset = self.fp.tell()
+        for e in self.entries:
+            big = [v for v in (e["usize"], e["csize"], e["offset"]) if v >= ZIP64_LIMIT]
+            extra = struct.pack(f"<HH{len(big)}Q", 1, 8 * len(big), *big) if big else b""
+            version = 45 if big else e["version"]
+            self.fp.write(_CENTRAL.pack(0x02014B50, _MADE_BY | version, version, e["flags"], e["method"],
+                                        e["time"], e["date"], e["crc"], _clamp(e["csize"]), _clamp(e["usize"]),
+                                        len(e["name"]), len(extra), 0, 0, 0, e["attr"], _clamp(e["offset"]))
+                          + e["name"] + extra)
+        cd_end = self.fp.tell()
+        n, cd_size = len(self.entries), cd_end - cd_offset
+        if n >= 0xFFFF or cd_size >= ZIP64_LIMIT or cd_offset >= ZIP64_LIMIT:
+            self.fp.write(_END64.pack(0x06064B50, _END64.size - 12, _MADE_BY | 45, 45, 0, 0,
+                                      n, n, cd_size, cd_offset))
+            self.fp.write(_LOCATOR64.pack(0x07064B50, 0, cd_end, 1))
+        self.fp.write(_END.pack(0x06054B50, 0, 0, min(n, 0xFFFF), min(n, 0xFFFF),
+                                _clamp(cd_size), _clamp(cd_offset), 0))
+        self.fp.close()
+
+    def abort(self) -> None:
+        self.fp.close()
+
+def _write_deflated(z: ZipWriter, path: str, arcname: str, res: dict) -> None:
+    spool = res["spool"]
+    csize = spool.tell()
+    spool.seek(0)
+    st = os.stat(path)
+    z.add_compressed(arcname, spool, res["crc"], csize, res["size"], st.st_mtime, st.st_mode)
+    spool.close()
+
+def _write_stored(z: ZipWriter, path: str, arcname: str) -> dict:
+    """Copia sin recomprimir; SHA-256 y CRC-32 se calculan en la misma lectura."""
+    before = stat_key(path)
+    st = os.stat(path)
+    with open(path, "rb", buffering=0) as f:
+        sha = z.add_stored(arcname, f, before[0], st.st_mtime, st.st_mode)
+    _check_unchanged(path, before)
+    return {"sha256": sha, "stat": before}
+
+def _assemble(z: ZipWriter, pool: ThreadPoolExecutor, members, workers: int, level: int,
+              digests: dict) -> None:
+    # como mucho 2×workers miembros comprimidos esperando a escribirse, en orden de `members`
+    pending = deque()
+
+    def drain_one():
+        path, arcname, fut = pending.popleft()
+        if fut is None:
+            res = _write_stored(z, path, arcname)
+        else:
+            res = fut.result()
+            _write_deflated(z, path, arcname, res)
+        digests[path] = {"sha256": res["sha256"], "stat": res["stat"]}
+
+    try:
+        for path, arcname in members:
+            path = str(path)
+            fut = None if is_precompressed(path) else pool.submit(_deflate_member, path, level)
+            pending.append((path, arcname, fut))
+            if len(pending) > 2 * workers:
+                drain_one()
+        while pending:
+            drain_one()
+    finally:
+        for _, _, fut in pending:  # error a medias: no dejar spools abiertos
+            if fut is not None and not fut.cancel() and fut.exception() is None:
+                fut.result()["spool"].close()
+
+def write_audit_zip(out: str | Path, members: list[tuple[str | Path, str]],
+                    extra: dict[str, bytes] | None = None, checksums: str | None = "SHA256SUMS",
+                    workers: int | None = None, level: int = COMPRESS_LEVEL) -> dict[str, dict]:
+    """Escribe `out` con los ficheros `members` [(ruta, arcname)], en ese orden, los miembros en
+    memoria `extra` {arcname: bytes} y, si `checksums`, un listado "sha256  arcname" de los ficheros.
+    Devuelve {ruta: {"sha256", "stat"}} de lo leído, con el stat (size, mtime_ns, inode) previo
+    a la lectura para poder alimentar la caché de hashes."""
+    workers = workers or min(32, os.cpu_count() or 1)
+    digests = {}
+    tmp = Path(out).with_suffix(Path(out).suffix + ".tmp")
+    z = ZipWriter(tmp)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            _assemble(z, pool, members, workers, level, digests)
+        for arcname, data in (extra or {}).items():
+            z.writestr(arcname, data, level)
+        if checksums:
+            z.writestr(checksums, "".join(f"{digests[str(p)]['sha256']}  {a}\n" for p, a in members), level)
+        z.close()
+    except BaseException:
+        z.abort()
+        tmp.unlink(missing_ok=True)
+        raise
+    os.replace(tmp, out)  # el ZIP final solo aparece completo
+    return digests
@@ -1,26 +1,35 @@
 import json, os
 from pathlib import Path
 from datetime import datetime
-from merkle import build_manifest
+from merkle import HASH_CACHE_FILE, build_manifest, build_proofs, load_hash_cache, save_hash_cache
 
 RUN_ID = os.environ.get("STEELTRACE_RUN_ID", "2025Q1-ACME-0001")
+MANIFEST_FILE = Path("evidence/evidence_manifest.json")
 
 ARTIFACTS = [
     "raga/kpis.json",
     "raga/explain.json",
     "ontology/validation.log",
     "ontology/linaje.ttl",
+    "ontology/linaje.nt",
+    "ontology/linaje.nt.gz",
     "ops/gate_report.json",
     "eee/eee_report.json",
     "xbrl/informe.xbrl",
     "xbrl/validation.log"
 ]
+# shacl_validate.py --lineage decide qué formatos de linaje se generan; se sellan los que existan
+LINEAGE_ARTIFACTS = {"ontology/linaje.ttl", "ontology/linaje.nt", "ontology/linaje.nt.gz"}
 
 def main():
     Path("evidence/tokens").mkdir(parents=True, exist_ok=True)
     Path("evidence/verify").mkdir(parents=True, exist_ok=True)
 
-    man = build_manifest(ARTIFACTS, RUN_ID)
+    artifacts = [a for a in ARTIFACTS if a not in LINEAGE_ARTIFACTS or Path(a).exists()]
+    previous = json.loads(MANIFEST_FILE.read_text(encoding="utf-8")) if MANIFEST_FILE.exists() else None
+    hash_cache = load_hash_cache(HASH_CACHE_FILE)
+    man = build_manifest(artifacts, RUN_ID, previous=previous, hash_cache=hash_cache)
+    save_hash_cache(HASH_CACHE_FILE, hash_cache)
     man["created_utc"] = datetime.utcnow().isoformat() + "Z"
     token = {
         "tsa": "SIMULATED-TSA",
@@ -29,10 +38,12 @@ def main():
     }
     man["tsa_tokens"] = [token]
 
-    Path("evidence/evidence_manifest.json").write_text(json.dumps(man, indent=2, ensure_ascii=False))
+    MANIFEST_FILE.write_text(json.dumps(man, indent=2, ensure_ascii=False))
+    Path("evidence/proofs.json").write_text(json.dumps(build_proofs(man), indent=2, ensure_ascii=False))
     Path("evidence/tokens/2025Q1.tsr").write_text(json.dumps(token, indent=2))
     Path("evidence/verify/2025Q1.txt").write_text("Verification: OK (simulated)\n")
     print("Evidence manifest → evidence/evidence_manifest.json")
+    print("Inclusion proofs  → evidence/proofs.json")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,55 @@
+import os, pickle
+from pathlib import Path
+import rdflib
+from rdflib import Graph
+from utils_hash import sha256_file
+
+# Caché persistente de grafos RDF parseados (ontología y shapes SHACL). La clave
+# es el SHA-256 del fichero fuente más la versión de rdflib: si el TTL cambia,
+# la entrada deja de encontrarse y se vuelve a parsear. Las tripletas se guardan
+# con pickle, que se carga mucho más rápido que volver a parsear Turtle.
+
+CACHE_DIR = Path("ontology/.graph_cache")
+
+def _cache_name(path: Path) -> str:
+    return f"{path.parent.name}_{path.stem}"
+
+def _cache_file(path: Path, digest: str, cache_dir: Path) -> Path:
+    return cache_dir / f"{_cache_name(path)}-{digest[:16]}-rdflib{rdflib.__version__}.pkl"
+
+def load_graph(path: str | Path, fmt: str = "turtle", into: Graph | None = None,
+               cache_dir: Path | None = CACHE_DIR) -> Graph:
+    """Parsea `path` (o lo recupera de la caché) y añade sus tripletas a `into` o a un Graph nuevo."""
+    path = Path(path)
+    g = into if into is not None else Graph()
+    if cache_dir is None:
+        g.parse(path, format=fmt)
+        return g
+    cached = _cache_file(path, sha256_file(path), cache_dir)
+    if cached.exists():
+        try:
+            with open(cached, "rb") as f:
+                namespaces, triples = pickle.load(f)
+        except Exception:
+            cached.unlink(missing_ok=True)  # entrada corrupta o de otra versión: se regenera
+        else:
+            for prefix, ns in namespaces:
+                g.bind(prefix, ns, override=False)
+            g.addN((s, p, o, g) for s, p, o in triples)
+            return g
+    part = Graph()
+    part.parse(path, format=fmt)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = cached.with_suffix(f".tmp{os.getpid()}")
+    with open(tmp, "wb") as f:
+        pickle.dump((list(part.namespaces()), list(part)), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, cached)  # escritura atómica: los workers pueden leer a la vez
+    for old in cache_dir.glob(f"{_cache_name(path)}-*.pkl"):
+        if old != cached:
+            old.unlink(missing_ok=True)
+    if into is None:
+        return part
+    for prefix, ns in part.namespaces():
+        g.bind(prefix, ns, override=False)
+    g.addN((s, p, o, g) for s, p, o in part)
+    return g
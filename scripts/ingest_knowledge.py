@@ -1,35 +1,90 @@
+import argparse
 import json
+import os
 import sys
 from pathlib import Path
+from utils_hash import sha256_file
 
 # Truco para importar módulos desde la carpeta superior
 sys.path.append(str(Path(__file__).parent.parent))
-from modules.gices_brain import ingest_pdfs
+from modules.gices_brain import extract_pdfs
+from modules.knowledge_index import build_index, save_index, write_chunks, open_chunks
 
 KB_DIR = Path("rag/knowledge_base")
-INDEX_FILE = Path("rag/index.json")
+CHUNKS_FILE = Path("rag/chunks.jsonl")
+BM25_FILE = Path("rag/bm25_index.json")
+MANIFEST_FILE = Path("rag/manifest.json")
+
+def load_previous():
+    """Manifiesto {sha256: {source, first, chunks}} y fragmentos de la ingesta anterior."""
+    store = open_chunks(CHUNKS_FILE)
+    if store is None or not MANIFEST_FILE.exists():
+        return {}, None
+    manifest = json.loads(MANIFEST_FILE.read_text(encoding="utf-8")).get("documents", {})
+    # Manifiestos anteriores al formato JSONL no tienen offsets: se re-extrae todo
+    if any("first" not in m for m in manifest.values()):
+        return {}, None
+    return manifest, store
 
 def main():
+    ap = argparse.ArgumentParser(description="Ingesta incremental de la biblioteca normativa (PDF).")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                    help="procesos para extraer páginas (1 = secuencial)")
+    args = ap.parse_args()
+
     print("🎓 GICES-RAGA: Iniciando Ingesta de Conocimiento...")
-    
+
     # Crear directorio si no existe (aunque deberías haber subido los PDFs aquí)
     KB_DIR.mkdir(parents=True, exist_ok=True)
-    
-    # 1. Leer PDFs
-    knowledge = ingest_pdfs(KB_DIR)
-    
-    if not knowledge:
+
+    # 1. Leer PDFs (solo los nuevos o modificados; el resto se reutiliza por hash)
+    old_manifest, old_store = load_previous()
+    pdfs = [(f, sha256_file(f)) for f in sorted(KB_DIR.glob("*.pdf"))]
+    reuse = {f: old_manifest[sha] for f, sha in pdfs if sha in old_manifest}
+
+    print(f"📂 Leyendo PDFs desde: {KB_DIR}")
+    extracted = extract_pdfs([f for f, _ in pdfs if f not in reuse], workers=args.workers)
+
+    manifest = {}
+    def stream():
+        # Los fragmentos reutilizados se copian línea a línea desde el JSONL anterior
+        n = 0
+        for f, sha in pdfs:
+            if f in reuse:
+                prev = reuse[f]
+                chunks = (dict(old_store[i], source=f.name)
+                          for i in range(prev["first"], prev["first"] + prev["chunks"]))
+            elif f in extracted:
+                chunks = extracted[f]
+            else:
+                continue
+            first = n
+            for c in chunks:
+                n += 1
+                yield c
+            manifest[sha] = {"source": f.name, "first": first, "chunks": n - first}
+
+    # 2. Guardar base de conocimiento (JSONL + offsets)
+    total = write_chunks(stream(), CHUNKS_FILE)
+    if old_store is not None:
+        old_store.close()
+    pruned = len(set(old_manifest) - set(manifest))
+    MANIFEST_FILE.write_text(json.dumps({"documents": manifest}, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    if not total:
         print("⚠️ No se encontraron PDFs en rag/knowledge_base/")
         print("   Por favor sube: Reglamento Restauración, Nature Credits, etc.")
         return
 
-    # 2. Guardar Índice
-    Path("rag").mkdir(exist_ok=True)
-    with open(INDEX_FILE, "w", encoding="utf-8") as f:
-        json.dump(knowledge, f, indent=2, ensure_ascii=False)
-        
-    print(f"✅ Ingesta Completada. {len(knowledge)} fragmentos indexados.")
-    print(f"📍 Índice guardado en: {INDEX_FILE}")
+    # 3. Índice invertido BM25 (se calcula una sola vez aquí, no en cada consulta)
+    store = open_chunks(CHUNKS_FILE)
+    save_index(build_index(store), BM25_FILE)
+    store.close()
+
+    print(f"✅ Ingesta Completada. {total} fragmentos indexados.")
+    print(f"   PDFs extraídos: {len(extracted)} | reutilizados: {len(reuse)} | eliminados: {pruned}")
+    print(f"📍 Base de conocimiento guardada en: {CHUNKS_FILE}")
+    print(f"📍 Índice BM25 guardado en: {BM25_FILE}")
 
 if __name__ == "__main__":
     main()
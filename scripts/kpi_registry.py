@@ -0,0 +1,129 @@
+import json
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# Registro declarativo de KPIs deterministas (ESRS E1, S1, G1).
+# Cada KPI es una fórmula columnar sobre el dataset normalizado de su dominio:
+#   num / den  → se suman por grupo (company_id, period) y se dividen al final,
+#                de modo que los ratios se agregan correctamente (ratio de sumas).
+# Sin "den" el KPI es una suma simple.
+# El total del grupo suma las entidades de cada periodo y después agrega los
+# periodos según "across_periods": "sum" (flujos, por defecto), "last" (stocks:
+# el valor del último periodo) o "mean"; un dict {"num": ..., "den": ...} lo fija
+# por término (p. ej. bajas acumuladas / plantilla media).
+
+DEFAULT_EMISSION_FACTOR = 0.23  # kgCO2e/kWh si el registro no trae emission_factor_co2e
+GROUP_BY = ["company_id", "period"]
+LINEAGE_FILE = Path("data/lineage.jsonl")  # escrito por mcp_ingest.py
+
+KPI_REGISTRY = [
+    {"id": "E1-1.co2e", "domain": "energy", "unit": "tCO2e",
+     "num": lambda d: d["kwh"] * d["emission_factor_co2e"] / 1000,
+     "narrative": "Suma de kWh × factor de emisión del registro (por defecto 0.23) / 1000."},
+    {"id": "E1-1.energy_mwh", "domain": "energy", "unit": "MWh",
+     "num": lambda d: d["kwh"] / 1000,
+     "narrative": "Consumo energético total en MWh."},
+    {"id": "S1-6.headcount_end", "domain": "hr", "unit": "FTE",
+     "num": lambda d: d["employees_end"],
+     "across_periods": "last",
+     "narrative": "Plantilla al cierre del periodo."},
+    {"id": "S1-6.turnover_rate", "domain": "hr", "unit": "ratio",
+     "num": lambda d: d["exits"],
+     "den": lambda d: (d["employees_start"] + d["employees_end"]) / 2,
+     "across_periods": {"num": "sum", "den": "mean"},
+     "narrative": "Bajas / plantilla media del periodo."},
+    {"id": "G1-4.cases_opened", "domain": "ethics", "unit": "count",
+     "num": lambda d: d["cases_opened"],
+     "narrative": "Casos de ética abiertos en el periodo."},
+    {"id": "G1-4.resolution_rate", "domain": "ethics", "unit": "ratio",
+     "num": lambda d: d["closed_with_resolution"],
+     "den": lambda d: d["cases_closed"],
+     "narrative": "Casos cerrados con resolución / casos cerrados."},
+]
+
+def _prepare_energy(d: pd.DataFrame) -> pd.DataFrame:
+    ef = d["emission_factor_co2e"] if "emission_factor_co2e" in d else pd.Series(np.nan, index=d.index)
+    return d.assign(period=d["period_start"].str[:7],
+                    emission_factor_co2e=ef.fillna(DEFAULT_EMISSION_FACTOR))
+
+PREPARE = {"energy": _prepare_energy}
+
+def normalized_inputs(data_dir: str | Path, lineage: str | Path = LINEAGE_FILE) -> dict[str, list[Path]]:
+    """{dominio: [normalizados]} según data/lineage.jsonl, que mcp_ingest reescribe en cada
+    ejecución (así no se cuelan normalizados obsoletos ni faltan los de nombre sin prefijo).
+    Sin linaje, los `<dominio>_*.json` de `data_dir`."""
+    domains = sorted({k["domain"] for k in KPI_REGISTRY})
+    found = {d: set() for d in domains}
+    lineage = Path(lineage)
+    if lineage.exists():
+        for line in lineage.read_text(encoding="utf-8").splitlines():
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if row.get("domain") in found and row.get("normalized"):
+                found[row["domain"]].add(Path(row["normalized"]))
+    else:
+        for d in domains:
+            found[d].update(Path(data_dir).glob(f"{d}_*.json"))
+    return {d: sorted(paths) for d, paths in found.items()}
+
+def load_frames(data_dir: str | Path, lineage: str | Path = LINEAGE_FILE) -> dict[str, pd.DataFrame]:
+    """Un DataFrame por dominio con todos sus ficheros normalizados (ver normalized_inputs)."""
+    frames = {}
+    for domain, paths in normalized_inputs(data_dir, lineage).items():
+        parts = [pd.DataFrame(json.loads(p.read_text(encoding="utf-8"))) for p in paths]
+        parts = [p for p in parts if not p.empty]
+        if parts:
+            frames[domain] = pd.concat(parts, ignore_index=True)
+    return frames
+
+def _ratio(num, den):
+    if den is None:
+        return num
+    return num / den.where(den != 0)
+
+def _across(per_period: pd.Series, how: str):
+    """Agrega una serie indexada por periodo (orden cronológico) en el total del grupo."""
+    if how == "sum":
+        return per_period.sum()
+    if how == "mean":
+        return per_period.mean()
+    if how == "last":
+        dated = per_period[per_period.index.notna()]
+        return (dated if len(dated) else per_period).iloc[-1]
+    raise ValueError(f"across_periods desconocido: {how}")
+
+def _across_spec(kpi: dict, term: str) -> str:
+    how = kpi.get("across_periods", "sum")
+    return how.get(term, "sum") if isinstance(how, dict) else how
+
+def _py(v):
+    return None if pd.isna(v) else float(v)
+
+def compute_kpis(frames: dict[str, pd.DataFrame]) -> tuple[dict, dict]:
+    """Evalúa el registro. Devuelve (totales del grupo, {entidad: {periodo: {kpi: valor}}})."""
+    totals, by_entity = {}, {}
+    for domain, frame in frames.items():
+        kpis = [k for k in KPI_REGISTRY if k["domain"] == domain]
+        d = PREPARE.get(domain, lambda x: x)(frame)
+        cols = {}
+        for i, k in enumerate(kpis):
+            cols[f"num{i}"] = k["num"](d)
+            if "den" in k:
+                cols[f"den{i}"] = k["den"](d)
+        terms = pd.DataFrame(cols).astype(float)
+        grouped = terms.groupby([d[c] for c in GROUP_BY]).sum()
+        per_period = terms.groupby(d["period"], dropna=False).sum().sort_index()
+
+        for i, k in enumerate(kpis):
+            total_num = _across(per_period[f"num{i}"], _across_spec(k, "num"))
+            total_den = _across(per_period[f"den{i}"], _across_spec(k, "den")) if "den" in k else None
+            totals[k["id"]] = _py(total_num if total_den is None
+                                  else total_num / total_den if total_den != 0 else np.nan)
+            den = f"den{i}" if "den" in k else None
+            values = _ratio(grouped[f"num{i}"], grouped[den] if den else None)
+            for (entity, period), v in values.items():
+                by_entity.setdefault(entity, {}).setdefault(period, {})[k["id"]] = _py(v)
+    return totals, by_entity
@@ -1,30 +1,23 @@
-import json, re
+import json, os, re, argparse
 from pathlib import Path
 from datetime import datetime
+import numpy as np
 import pandas as pd
-from jsonschema import Draft202012Validator
-from utils_hash import sha256_file, sha256_json, write_json
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from jsonschema.validators import validator_for
+from utils_hash import sha256_json, write_json
+from merkle import file_digests
 import yaml # pyyaml es necesario para load_yaml
 
 # -------- Config --------
-SAMPLES = {
-    "energy": {
-        "input": "data/samples/energy_2024-01.json",
-        "schema": "contracts/erp_energy.schema.json",
-        "normalized": "data/normalized/energy_2024-01.json"
-    },
-    "hr": {
-        "input": "data/samples/hr_2024-01.json",
-        "schema": "contracts/hr_people.schema.json",
-        "normalized": "data/normalized/hr_2024-01.json"
-    },
-    "ethics": {
-        "input": "data/samples/ethics_2024-01.json",
-        "schema": "contracts/ethics_cases.schema.json",
-        "normalized": "data/normalized/ethics_2024-01.json"
-    }
-}
+CATALOG_FILE = "contracts/datasets.yaml"
+LINEAGE_FILE = "data/lineage.jsonl"
 DQ_RULES_FILE = "contracts/dq_rules.yaml"
+DQ_CATEGORIES = ["completeness", "validity", "consistency", "timeliness"]
+CHUNK_SIZE = 50_000          # registros por bloque en memoria
+MAX_SCHEMA_ERRORS = 1_000    # errores de esquema detallados en dq_report.json
+READ_BLOCK = 1 << 20         # bytes leídos por iteración del parser incremental
 
 # -------- Helpers DQ --------
 def is_date_iso(s: str) -> bool:
@@ -41,62 +34,146 @@ def within_month(date_str: str, month: str) -> bool:
     # month = 'YYYY-MM'
     return date_str.startswith(month)
 
-def apply_rule(row: dict, rule: dict, domain: str) -> bool:
-    # Supports simple predicates used in dq_rules.yaml
+# -------- Motor DQ compilado --------
+# Cada regla de dq_rules.yaml se compila una sola vez a un predicado que recibe
+# el DataFrame completo y devuelve una máscara booleana por fila. Los predicados
+# de texto/fecha se evalúan una vez por valor distinto (periodos y fechas se
+# repiten mucho en los extractos ERP/HR) y se propagan con factorize.
+
+# Clave ausente en el registro: distinta de un null explícito (None) y de un NaN,
+# igual que row.get(field) / row.get(field, default) en la evaluación por fila.
+ABSENT = type("Absent", (), {"__repr__": lambda self: "ABSENT"})()
+
+def _column(df: pd.DataFrame, field: str) -> pd.Series:
+    if field in df.columns:
+        return df[field]
+    return pd.Series(ABSENT, index=df.index, dtype=object)
+
+def _text(v) -> str:
+    return "" if v is ABSENT else str(v)  # str(row.get(field, ""))
+
+def _map_unique(s: pd.Series, fn) -> np.ndarray:
+    codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    ok = np.fromiter((bool(fn(u)) for u in uniques), dtype=bool, count=len(uniques))
+    out = np.zeros(len(s), dtype=bool)
+    mask = codes >= 0
+    out[mask] = ok[codes[mask]]
+    # None y NaN comparten el código -1 pero fn puede distinguirlos ("None" ≠ "nan"): fila a fila
+    out[~mask] = [bool(fn(v)) for v in s.to_numpy()[~mask]]
+    return out
+
+def _parse_date(v):
+    try:
+        return datetime.strptime(v, "%Y-%m-%d")
+    except Exception:
+        return None
+
+def _as_dates(s: pd.Series) -> np.ndarray:
+    # datetime de Python en un array de objetos, no datetime64[ns]: fechas abiertas como
+    # 9999-12-31 quedan fuera del rango de los timestamps en ns y deben seguir valiendo
+    codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    parsed = np.array([_parse_date(u) for u in uniques] + [None], dtype=object)
+    return parsed[codes]  # código -1 (nulo) → None del final
+
+def _le(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """a <= b por fila; False si alguno de los dos valores no se pudo convertir (None)."""
+    return np.fromiter((x is not None and y is not None and x <= y for x, y in zip(a, b)),
+                       dtype=bool, count=len(a))
+
+def _parse_int(v, missing: int):
+    try:
+        return missing if v is ABSENT else int(v)
+    except Exception:
+        return None
+
+def _as_int(s: pd.Series, missing: int = 0) -> np.ndarray:
+    # Equivale a int(row.get(field, missing)) con enteros de Python (exactos por encima de
+    # 2**53, a diferencia de pasar por float64): trunca decimales, la clave ausente toma
+    # `missing` y None, NaN o un texto no entero dan None (la regla falla)
+    codes, uniques = pd.factorize(s, use_na_sentinel=True)
+    parsed = np.array([_parse_int(u, missing) for u in uniques] + [None], dtype=object)
+    return parsed[codes]
+
+def _ints_le(a: np.ndarray, b: np.ndarray, offset: int = 0) -> np.ndarray:
+    """a <= b + offset por fila; en int64 cuando todos los valores caben, si no con enteros de Python."""
+    if not (np.equal(a, None).any() or np.equal(b, None).any()):
+        try:
+            ia, ib = a.astype(np.int64), b.astype(np.int64)
+        except OverflowError:
+            pass
+        else:
+            if not len(ib) or (abs(offset) < 1 << 62 and -(1 << 62) < ib.min() and ib.max() < 1 << 62):
+                return ia <= ib + offset
+    return _le(a, np.array([None if y is None else y + offset for y in b], dtype=object))
+
+def _non_negative(s: pd.Series) -> np.ndarray:
+    # float(row.get(field)) >= 0; con solo números (y nulos) se evalúa en float64, que conserva el signo
+    if pd.api.types.infer_dtype(s, skipna=True) in ("integer", "floating", "mixed-integer-float"):
+        return (pd.to_numeric(s, errors="coerce") >= 0).to_numpy()
+    def ok(v):
+        try:
+            return v is not None and float(v) >= 0
+        except Exception:
+            return False
+    return _map_unique(s, ok)
+
+def _compile_rule(rule: dict):
     name = rule.get("rule")
     field = rule.get("field")
     if name == "not_null":
-        return row.get(field) is not None
+        # row.get(field) is not None: un NaN cuenta como presente
+        return lambda df: np.not_equal(_column(df, field).to_numpy(), None) & \
+                          np.not_equal(_column(df, field).to_numpy(), ABSENT)
     if name == "is_date":
-        return is_date_iso(str(row.get(field, "")))
+        return lambda df: _map_unique(_column(df, field), lambda v: is_date_iso(_text(v)))
     if name == "is_yyyy_mm":
-        return is_yyyy_mm(str(row.get(field, "")))
+        return lambda df: _map_unique(_column(df, field), lambda v: is_yyyy_mm(_text(v)))
     if name == ">=0":
-        try:
-            val = row.get(field)
-            if val is None: return False
-            return float(val) >= 0
-        except Exception:
-            return False
+        return lambda df: _non_negative(_column(df, field))
     if name and name.startswith("within_month("):
         m = re.search(r"within_month\('([^']+)'\)", name)
         month = m.group(1) if m else ""
-        return within_month(str(row.get(field, "")), month)
+        return lambda df: _map_unique(_column(df, field), lambda v: within_month(_text(v), month))
     if name and name.startswith("equals("):
         m = re.search(r"equals\('([^']+)'\)", name)
         ref = m.group(1) if m else ""
-        return str(row.get(field, "")) == ref
+        return lambda df: _map_unique(_column(df, field), lambda v: _text(v) == ref)
     if name == "period_start <= period_end":
-        try:
-            ps = datetime.strptime(row.get("period_start"), "%Y-%m-%d")
-            pe = datetime.strptime(row.get("period_end"), "%Y-%m-%d")
-            return ps <= pe
-        except Exception:
-            return False
+        return lambda df: _le(_as_dates(_column(df, "period_start")), _as_dates(_column(df, "period_end")))
     if name == "employees_end <= employees_start + 1000":
-        try:
-            return int(row.get("employees_end", 0)) <= int(row.get("employees_start", 0)) + 1000
-        except Exception:
-            return False
+        return lambda df: _ints_le(_as_int(_column(df, "employees_end")), _as_int(_column(df, "employees_start")), 1000)
     if name == "closed_with_resolution <= cases_closed":
-        try:
-            return int(row.get("closed_with_resolution", 0)) <= int(row.get("cases_closed", 0))
-        except Exception:
-            return False
-    return True
+        return lambda df: _ints_le(_as_int(_column(df, "closed_with_resolution")), _as_int(_column(df, "cases_closed")))
+    return lambda df: np.ones(len(df), dtype=bool)
 
-def evaluate_dq(records: list[dict], rules: dict, domain: str) -> dict:
-    res = {"completeness": [], "validity": [], "consistency": [], "timeliness": []}
-    for cat in res.keys():
-        for r in rules.get(cat, []):
-            passed = sum(1 for row in records if apply_rule(row, r, domain))
-            total = max(1, len(records))
-            res[cat].append({"rule": r, "pass_rate": passed / total})
+def compile_rules(rules: dict) -> list[tuple[str, dict, object]]:
+    """[(categoría, regla, predicado)] en el orden de dq_rules.yaml."""
+    return [(cat, r, _compile_rule(r)) for cat in DQ_CATEGORIES for r in rules.get(cat, [])]
+
+def records_frame(records: list[dict]) -> pd.DataFrame:
+    # dtype=object y ABSENT en las claves que faltan: null (None), NaN y ausente siguen siendo distintos
+    cols = dict.fromkeys(k for r in records for k in r)
+    return pd.DataFrame({c: [r.get(c, ABSENT) for r in records] for c in cols},
+                        index=pd.RangeIndex(len(records)), dtype=object)
+
+def dq_counts(df: pd.DataFrame, compiled: list) -> list[int]:
+    """Filas que cumplen cada regla compilada (evaluación columnar)."""
+    return [int(pred(df).sum()) for _, _, pred in compiled]
+
+def dq_result(compiled: list, counts: list[int], n_records: int) -> dict:
+    res = {cat: [] for cat in DQ_CATEGORIES}
+    total = max(1, n_records)
+    for (cat, r, _), passed in zip(compiled, counts):
+        res[cat].append({"rule": r, "pass_rate": passed / total})
     # Aggregate
     agg = {k: (sum(x["pass_rate"] for x in v) / max(1, len(v))) if v else 1.0 for k, v in res.items()}
     agg["dq_pass"] = all(v >= 0.95 for v in agg.values())
     return {"by_rule": res, "aggregate": agg}
 
+def evaluate_dq(records: list[dict], rules: dict, domain: str) -> dict:
+    compiled = compile_rules(rules)
+    return dq_result(compiled, dq_counts(records_frame(records), compiled), len(records))
+
 # -------- Load DQ rules --------
 def load_yaml(path: str) -> dict:
     with open(path, "r", encoding="utf-8") as f:
@@ -105,85 +182,377 @@ def load_yaml(path: str) -> dict:
 def json_load(path: str) -> dict | list:
     return json.loads(Path(path).read_text(encoding="utf-8"))
 
+# -------- Lectura/escritura en streaming --------
+def _iter_json_array(f):
+    """Parser incremental de un array JSON de nivel superior: emite elemento a elemento.
+    Tan estricto como json.loads: exactamente una coma entre elementos y nada tras el ']'."""
+    dec = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+    def more():
+        nonlocal buf, pos, eof
+        block = f.read(READ_BLOCK)
+        eof = not block
+        buf = buf[pos:] + block
+        pos = 0
+    # "open": antes del '['; "first": tras '[' (valor o ']'); "value": tras ',' (solo valor);
+    # "sep": tras un valor (',' o ']'); "done": tras ']' (solo espacios hasta EOF)
+    state = "open"
+    while True:
+        while pos < len(buf) and buf[pos].isspace():
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                if state == "done":
+                    return
+                raise ValueError("array JSON incompleto")
+            more()
+            continue
+        c = buf[pos]
+        if state == "done":
+            raise ValueError(f"datos extra tras el array JSON: {buf[pos:pos + 20]!r}")
+        if state == "open":
+            if c != "[":
+                raise ValueError("se esperaba una lista de objetos JSON")
+            state, pos = "first", pos + 1
+            continue
+        if state == "sep":
+            if c == ",":
+                state, pos = "value", pos + 1
+            elif c == "]":
+                state, pos = "done", pos + 1
+            else:
+                raise ValueError(f"se esperaba ',' o ']' entre elementos: {buf[pos:pos + 20]!r}")
+            continue
+        if c == "]" and state == "first":
+            state, pos = "done", pos + 1
+            continue
+        if c in ",]":
+            raise ValueError(f"se esperaba un valor: {buf[pos:pos + 20]!r}")
+        try:
+            obj, end = dec.raw_decode(buf, pos)
+            # Un valor que llega al final del bloque puede estar cortado (p. ej. "1.5" de "1.5e10"):
+            # solo se acepta si le sigue un separador o ya no queda nada por leer
+            if not eof and (end >= len(buf) or buf[end] not in " \t\n\r,]"):
+                raise json.JSONDecodeError("posible valor truncado", buf, end)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            more()
+            continue
+        yield obj
+        state, pos = "sep", end
+
+def iter_records(path: str | Path, chunk_size: int = CHUNK_SIZE):
+    """Lee JSON Lines (.jsonl/.ndjson) o un array JSON en bloques de `chunk_size` registros."""
+    path = Path(path)
+    with open(path, "r", encoding="utf-8") as f:
+        if path.suffix in (".jsonl", ".ndjson"):
+            items = (json.loads(line) for line in f if line.strip())
+        else:
+            items = _iter_json_array(f)
+        chunk = []
+        for obj in items:
+            chunk.append(obj)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+class JsonArrayWriter:
+    """Escribe un array JSON registro a registro con el mismo formato que write_json (indent=2).
+    Se escribe sobre un .tmp que solo sustituye al destino en close(); abort() lo descarta."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        self.f = open(self.tmp, "w", encoding="utf-8")
+        self.count = 0
+
+    def write(self, records: list[dict]) -> None:
+        for rec in records:
+            body = json.dumps(rec, indent=2, ensure_ascii=False).replace("\n", "\n  ")
+            self.f.write(("[\n  " if self.count == 0 else ",\n  ") + body)
+            self.count += 1
+
+    def close(self) -> None:
+        self.f.write("\n]" if self.count else "[]")
+        self.f.close()
+        os.replace(self.tmp, self.path)
+
+    def abort(self) -> None:
+        self.f.close()
+        self.tmp.unlink(missing_ok=True)
+
+# -------- Validación JSON Schema --------
+# Subconjunto de JSON Schema que usan los contratos de contracts/*.schema.json. Si un
+# esquema solo usa estas palabras clave se compila a un predicado Python de validez;
+# si no, se usa is_valid de jsonschema. Los mensajes de error siempre los da jsonschema.
+_ANNOTATIONS = {"$schema", "$id", "$comment", "title", "description", "format"}  # format no se valida sin format_checker
+_TYPES = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "boolean": lambda v: isinstance(v, bool),
+    "null": lambda v: v is None,
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "integer": lambda v: (isinstance(v, int) and not isinstance(v, bool)) or (isinstance(v, float) and v.is_integer()),
+}
+# Mismas comparaciones que jsonschema (falla si instance < minimum, etc.): con NaN
+# ambas rutas aceptan el valor y el camino rápido no puede discrepar de iter_errors
+_SIMPLE = {
+    "minimum": ("number", lambda v, x: not v < x),
+    "maximum": ("number", lambda v, x: not v > x),
+    "exclusiveMinimum": ("number", lambda v, x: not v <= x),
+    "exclusiveMaximum": ("number", lambda v, x: not v >= x),
+    "minLength": ("string", lambda v, x: len(v) >= x),
+    "maxLength": ("string", lambda v, x: len(v) <= x),
+    "pattern": ("string", lambda v, x: re.search(x, v) is not None),
+}
+
+def _compile_schema(schema: dict):
+    """Predicado instancia → bool, o None si el esquema usa palabras clave no soportadas."""
+    if not isinstance(schema, dict):
+        return None
+    checks = []
+    for kw, arg in schema.items():
+        if kw in _ANNOTATIONS:
+            continue
+        if kw == "type":
+            types = [_TYPES[t] for t in ([arg] if isinstance(arg, str) else arg) if t in _TYPES]
+            if len(types) != (1 if isinstance(arg, str) else len(arg)):
+                return None
+            checks.append(lambda v, types=types: any(t(v) for t in types))
+        elif kw in _SIMPLE:
+            is_t, op = _TYPES[_SIMPLE[kw][0]], _SIMPLE[kw][1]
+            checks.append(lambda v, is_t=is_t, op=op, arg=arg: not is_t(v) or op(v, arg))
+        elif kw == "required":
+            checks.append(lambda v, req=tuple(arg): not isinstance(v, dict) or all(k in v for k in req))
+        elif kw == "properties":
+            props = {k: _compile_schema(sub) for k, sub in arg.items()}
+            if any(c is None for c in props.values()):
+                return None
+            checks.append(lambda v, props=props: not isinstance(v, dict)
+                          or all(c(v[k]) for k, c in props.items() if k in v))
+        elif kw == "additionalProperties" and arg is False and "patternProperties" not in schema:
+            allowed = frozenset(schema.get("properties", {}))
+            checks.append(lambda v, allowed=allowed: not isinstance(v, dict) or allowed.issuperset(v))
+        elif kw == "additionalProperties" and arg is True:
+            continue
+        else:
+            return None
+    return lambda v: all(c(v) for c in checks)
+
+@lru_cache(maxsize=None)
+def compiled_validator(schema_path: str):
+    """(validador jsonschema, predicado compilado o is_valid), una vez por esquema y proceso."""
+    schema = json_load(schema_path)
+    cls = validator_for(schema)
+    cls.check_schema(schema)
+    validator = cls(schema)
+    return validator, _compile_schema(schema) or validator.is_valid
+
+def validate_batch(schema_path: str, records: list[dict], start: int) -> tuple[list[dict], list[dict]]:
+    """(válidos, errores). Camino rápido de validez; el detalle solo para las filas que fallan."""
+    validator, is_valid = compiled_validator(schema_path)
+    valid_records, errors = [], []
+    for i, rec in enumerate(records, start=start):
+        if is_valid(rec):
+            valid_records.append(rec)
+        else:
+            errs = sorted(validator.iter_errors(rec), key=lambda e: e.path)
+            errors.append({"index": i, "errors": [e.message for e in errs]})
+    return valid_records, errors
+
+def _validate_batch_task(args):
+    return validate_batch(*args)
+
+def validate_chunk(schema_path: str, records: list[dict], start: int, pool=None, workers: int = 1):
+    if pool is None or len(records) < 2 * workers:
+        return validate_batch(schema_path, records, start)
+    # Reparto en lotes contiguos; map conserva el orden de los registros
+    size = -(-len(records) // workers)
+    tasks = [(schema_path, records[i:i + size], start + i) for i in range(0, len(records), size)]
+    valid_records, errors = [], []
+    for v, e in pool.map(_validate_batch_task, tasks):
+        valid_records.extend(v)
+        errors.extend(e)
+    return valid_records, errors
+
+# -------- Catálogo de datasets --------
+def _glob_root(pattern: str) -> Path:
+    """Parte fija de un glob (hasta el primer componente con comodines)."""
+    parts = []
+    for part in Path(pattern).parts:
+        if any(c in part for c in "*?["):
+            break
+        parts.append(part)
+    return Path(*parts) if parts else Path(".")
+
+def normalized_name(src: Path, root: Path) -> str:
+    """Nombre del normalizado a partir de la ruta relativa a la raíz del glob: los
+    subdirectorios (filiales) forman parte del nombre, p. ej. ACME/energy_2024-01.json
+    → ACME__energy_2024-01.json; un fichero directamente bajo la raíz conserva su nombre."""
+    rel = src.relative_to(root).with_suffix("")
+    return "__".join(rel.parts) + ".json"
+
+def load_catalog(path: str = CATALOG_FILE) -> list[dict]:
+    """Un trabajo por fichero descubierto: {domain, input, schema, rules, normalized, period}."""
+    cat = load_yaml(path)
+    out_dir = Path(cat.get("normalized_dir", "data/normalized"))
+    period_re = re.compile(cat.get("period_regex", r"(\d{4}-\d{2})"))
+    jobs, seen = [], {}
+    for domain, ds in cat["datasets"].items():
+        patterns = [ds["inputs"]] if isinstance(ds["inputs"], str) else ds["inputs"]
+        files = sorted({(p, _glob_root(pat)) for pat in patterns for p in Path(".").glob(pat)})
+        for src, root in files:
+            dst = out_dir / normalized_name(src, root)
+            if dst in seen:
+                raise ValueError(f"{src} y {seen[dst]} producirían el mismo normalizado {dst}")
+            seen[dst] = src
+            m = period_re.search(src.name)
+            jobs.append({
+                "domain": domain,
+                "input": str(src),
+                "schema": ds["schema"],
+                "rules": ds.get("rules", domain),
+                "normalized": str(dst),
+                "period": m.group(1) if m else None
+            })
+    return jobs
+
+def render_rules(rules: dict, period: str | None) -> dict:
+    """Sustituye {period} en las reglas DQ por el periodo del fichero."""
+    if period is None:
+        return rules
+    return {cat: [{k: v.replace("{period}", period) if isinstance(v, str) else v for k, v in r.items()}
+                  for r in lst] for cat, lst in rules.items()}
+
+# -------- Ingesta de un fichero --------
+def ingest_domain(domain: str, cfg: dict, rules: dict, chunk_size: int = CHUNK_SIZE,
+                  schema_workers: int = 1) -> dict:
+    """Valida, aplica DQ y escribe el normalizado en bloques acotados (memoria constante)."""
+    src = Path(cfg["input"])
+    sch = Path(cfg["schema"])
+    dst = Path(cfg["normalized"])
+
+    compiled = compile_rules(rules)
+    counts = [0] * len(compiled)
+    n_total, n_valid, n_errors, errors = 0, 0, 0, []
+
+    writer = JsonArrayWriter(dst)
+    pool = ProcessPoolExecutor(max_workers=schema_workers) if schema_workers > 1 else None
+    try:
+        # 1) Cargar datos por bloques
+        for chunk in iter_records(src, chunk_size):
+            # 2) Validar JSON Schema
+            valid_records, errs = validate_chunk(str(sch), chunk, n_total, pool, schema_workers)
+            n_errors += len(errs)
+            errors.extend(errs[:MAX_SCHEMA_ERRORS - len(errors)])
+            n_total += len(chunk)
+            n_valid += len(valid_records)
+
+            # 3) Escribir normalizados (solo válidos)
+            writer.write(valid_records)
+
+            # 4) DQ por reglas: contadores acumulados por bloque
+            if valid_records:
+                counts = [a + b for a, b in zip(counts, dq_counts(records_frame(valid_records), compiled))]
+    except BaseException as e:
+        writer.abort()  # sin normalizado truncado en disco
+        if isinstance(e, ValueError):
+            raise ValueError(f"{src} debe ser una lista de objetos JSON ({e})") from e
+        raise
+    else:
+        writer.close()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    summary = {
+        "source": str(src),
+        "schema": str(sch),
+        "records_total": n_total,
+        "records_valid": n_valid,
+        "schema_errors": errors,
+        "dq": dq_result(compiled, counts, n_valid)
+    }
+    if n_errors > len(errors):
+        summary["schema_errors_total"] = n_errors
+    return summary
+
+def ingest_job(job: dict, dq_rules: dict, chunk_size: int, schema_workers: int) -> tuple[dict, dict]:
+    """Ingesta de un fichero del catálogo: (resumen DQ, fila de linaje). Se ejecuta en el pool."""
+    rules = render_rules(dq_rules.get(job["rules"], {}), job["period"])
+    summary = ingest_domain(job["domain"], job, rules, chunk_size, schema_workers)
+    summary = {"domain": job["domain"], "period": job["period"], **summary}
+    # los hashes se rellenan en main, de una vez y con la caché compartida
+    lineage = {
+        "domain": job["domain"],
+        "src": job["input"],
+        "src_sha256": None,
+        "normalized": job["normalized"],
+        "normalized_sha256": None,
+        "utc": datetime.utcnow().isoformat() + "Z"
+    }
+    return summary, lineage
+
+def _ingest_job_task(args):
+    return ingest_job(*args)
+
 # -------- Main --------
 def main():
+    ap = argparse.ArgumentParser(description="Ingesta MCP: JSON Schema + DQ + normalizados + linaje.")
+    ap.add_argument("--catalog", default=CATALOG_FILE, help="catálogo de datasets (YAML)")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="procesos para ingerir ficheros/dominios en paralelo (1 = secuencial)")
+    ap.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                    help="registros procesados por bloque (acota la memoria)")
+    ap.add_argument("--schema-workers", type=int, default=1,
+                    help="procesos para validar JSON Schema por lotes dentro de cada fichero")
+    args = ap.parse_args()
+
     dq_rules = load_yaml(DQ_RULES_FILE)
+    jobs = load_catalog(args.catalog)
+    for job in jobs:
+        Path(job["normalized"]).parent.mkdir(parents=True, exist_ok=True)
 
-    normalized_paths = []
-    dq_summary = {}
-
-    for domain, cfg in SAMPLES.items():
-        src = Path(cfg["input"])
-        sch = Path(cfg["schema"])
-        dst = Path(cfg["normalized"])
-        dst.parent.mkdir(parents=True, exist_ok=True)
-
-        # 1) Cargar datos
-        records = json_load(src)
-        if not isinstance(records, list):
-            raise ValueError(f"{src} debe ser una lista de objetos JSON")
-
-        # 2) Validar JSON Schema
-        schema = json_load(sch)
-        validator = Draft202012Validator(schema)
-        valid_records, errors = [], []
-        for i, rec in enumerate(records):
-            errs = sorted(validator.iter_errors(rec), key=lambda e: e.path)
-            if errs:
-                errors.append({"index": i, "errors": [e.message for e in errs]})
-            else:
-                valid_records.append(rec)
-
-        # 3) Escribir normalizados (solo válidos)
-        write_json(dst, valid_records)
-        normalized_paths.append(str(dst))
-
-        # 4) DQ por reglas
-        rules = dq_rules.get(domain, {})
-        dq = evaluate_dq(valid_records, rules, domain)
-        dq_summary[domain] = {
-            "source": str(src),
-            "schema": str(sch),
-            "records_total": len(records),
-            "records_valid": len(valid_records),
-            "schema_errors": errors,
-            "dq": dq
-        }
-
-    # 5) Linaje y hashes
-    lineage_path = Path("data/lineage.jsonl")
-    lineage_path.parent.mkdir(parents=True, exist_ok=True)
-    lines = []
-    for domain, cfg in SAMPLES.items():
-        src = Path(cfg["input"])
-        dst = Path(cfg["normalized"])
-        lines.append(json.dumps({
-            "domain": domain,
-            "src": str(src),
-            "src_sha256": sha256_file(src),
-            "normalized": str(dst),
-            "normalized_sha256": sha256_file(dst),
-            "utc": datetime.utcnow().isoformat() + "Z"
-        }))
+    # 1-4) Un trabajo por fichero; map conserva el orden del catálogo (salidas reproducibles)
+    tasks = [(job, dq_rules, args.chunk_size, args.schema_workers) for job in jobs]
+    if args.workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            results = list(pool.map(_ingest_job_task, tasks))
+    else:
+        results = [_ingest_job_task(t) for t in tasks]
 
+    # 5) Linaje y hashes: una fila por normalizado
+    digests = file_digests([p for job in jobs for p in (job["input"], job["normalized"])])
+    for _, lineage in results:
+        lineage["src_sha256"] = digests[lineage["src"]]
+        lineage["normalized_sha256"] = digests[lineage["normalized"]]
+    lineage_path = Path(LINEAGE_FILE)
+    lineage_path.parent.mkdir(parents=True, exist_ok=True)
+    lines = [json.dumps(lineage) for _, lineage in results]
     lineage_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
 
     # 6) Reporte DQ agregado
-    def ok(dom):
-        agg = dq_summary[dom]["dq"]["aggregate"]
-        return all(agg[k] >= 0.95 for k in ["completeness","validity","consistency","timeliness"])
+    dq_summary = {Path(job["normalized"]).stem: summary for job, (summary, _) in zip(jobs, results)}
+    def ok(ds):
+        agg = dq_summary[ds]["dq"]["aggregate"]
+        return all(agg[k] >= 0.95 for k in DQ_CATEGORIES)
 
     dq_report = {
-        "domains": dq_summary,
-        "dq_pass": all(ok(dom) for dom in dq_summary.keys())
+        "datasets": dq_summary,
+        "dq_pass": all(ok(ds) for ds in dq_summary.keys())
     }
     write_json("data/dq_report.json", dq_report)
 
     print("Ingesta/DQ completada.")
     print("data/dq_report.json escrito.")
-    print("data/lineage.jsonl escrito.")
-    for p in normalized_paths:
-        print("OK →", p)
+    print(f"{LINEAGE_FILE} escrito.")
+    for job in jobs:
+        print("OK →", job["normalized"])
 
 if __name__ == "__main__":
     main()
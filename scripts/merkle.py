@@ -1,13 +1,18 @@
 from pathlib import Path
-import hashlib, json
+from concurrent.futures import ThreadPoolExecutor
+import hashlib, json, os, argparse
+from utils_hash import sha256_file  # streaming, búfer fijo
 
-def sha256_file(path: str | Path) -> str:
-    p = Path(path)
-    return hashlib.sha256(p.read_bytes()).hexdigest()
+# Árbol de Merkle del manifiesto de evidencias. Las hojas son los hex SHA-256 de
+# cada artefacto (como bytes UTF-8); cada nivel concatena pares y los hashea,
+# duplicando el último nodo si el nivel es impar; la raíz es el SHA-256 del
+# nodo final. Guardar todos los niveles permite pruebas de inclusión O(log n).
 
-def merkle_root_from_hashes(hashes: list[str]) -> str:
-    if not hashes: return ""
+def merkle_levels(hashes: list[str]) -> list[list[bytes]]:
+    """Niveles del árbol, de las hojas (nivel 0) al nodo superior."""
+    if not hashes: return []
     level = [h.encode("utf-8") for h in hashes]
+    levels = [level]
     while len(level) > 1:
         nxt = []
         for i in range(0, len(level), 2):
@@ -15,12 +20,203 @@ def merkle_root_from_hashes(hashes: list[str]) -> str:
             b = level[i+1] if i+1 < len(level) else a
             nxt.append(hashlib.sha256(a + b).digest())
         level = nxt
-    return hashlib.sha256(level[0]).hexdigest()
-
-def build_manifest(artifacts: list[str], run_id: str) -> dict:
-    rows = []
-    for a in artifacts:
-        sha = sha256_file(a)
-        rows.append({"path": a, "sha256": sha})
-    root = merkle_root_from_hashes([r["sha256"] for r in rows])
-    return {"run_id": run_id, "artifacts": rows, "merkle_root": f"SHA256:{root}"}
+        levels.append(level)
+    return levels
+
+def merkle_root_from_hashes(hashes: list[str]) -> str:
+    if not hashes: return ""
+    return hashlib.sha256(merkle_levels(hashes)[-1][0]).hexdigest()
+
+def _node_hex(level: int, node: bytes) -> str:
+    # las hojas ya son hex; los nodos internos son digests binarios
+    return node.decode("utf-8") if level == 0 else node.hex()
+
+def _node_bytes(level: int, value: str) -> bytes:
+    return value.encode("utf-8") if level == 0 else bytes.fromhex(value)
+
+class MerkleTree:
+    """Árbol completo de un manifiesto: raíz, pruebas de inclusión y serialización."""
+
+    def __init__(self, paths: list[str], levels: list[list[bytes]]):
+        self.paths = paths
+        self.levels = levels
+        self.index = {}
+        for i, p in enumerate(paths):
+            self.index.setdefault(p, i)
+
+    @classmethod
+    def from_hashes(cls, paths: list[str], hashes: list[str]) -> "MerkleTree":
+        return cls(paths, merkle_levels(hashes))
+
+    @classmethod
+    def from_manifest(cls, manifest: dict) -> "MerkleTree":
+        """Usa los niveles guardados en el manifiesto (sin rehashear) o los recalcula si no están."""
+        paths = [r["path"] for r in manifest["artifacts"]]
+        stored = manifest.get("merkle_tree", {}).get("levels")
+        if stored is None:
+            return cls.from_hashes(paths, [r["sha256"] for r in manifest["artifacts"]])
+        return cls(paths, [[_node_bytes(lv, h) for h in nodes] for lv, nodes in enumerate(stored)])
+
+    @property
+    def root(self) -> str:
+        return hashlib.sha256(self.levels[-1][0]).hexdigest() if self.levels else ""
+
+    def update(self, leaves: dict[int, str]) -> None:
+        """Sustituye hojas {índice: sha256} y recalcula solo sus caminos hasta la raíz."""
+        dirty = set()
+        for i, h in leaves.items():
+            self.levels[0][i] = _node_bytes(0, h)
+            dirty.add(i)
+        for lv in range(len(self.levels) - 1):
+            nodes, parents = self.levels[lv], {i // 2 for i in dirty}
+            for p in parents:
+                a = nodes[2 * p]
+                b = nodes[2 * p + 1] if 2 * p + 1 < len(nodes) else a
+                self.levels[lv + 1][p] = hashlib.sha256(a + b).digest()
+            dirty = parents
+
+    def to_dict(self) -> dict:
+        return {"levels": [[_node_hex(lv, n) for n in nodes] for lv, nodes in enumerate(self.levels)]}
+
+    def prove(self, path: str) -> dict:
+        """Prueba de inclusión de `path`: su hoja y el hermano de cada nivel hasta la raíz."""
+        if path not in self.index:
+            raise KeyError(f"{path} no está en el manifiesto")
+        i = self.index[path]
+        leaf = i
+        siblings = []
+        for lv, nodes in enumerate(self.levels[:-1]):
+            j = i ^ 1
+            sib = nodes[j] if j < len(nodes) else nodes[i]  # nivel impar: el último se empareja consigo mismo
+            siblings.append({"side": "L" if j < i else "R", "hash": _node_hex(lv, sib)})
+            i //= 2
+        return {"path": path, "index": leaf, "sha256": _node_hex(0, self.levels[0][leaf]), "siblings": siblings}
+
+def root_from_proof(sha256: str, proof: dict) -> str:
+    node = _node_bytes(0, sha256)
+    for lv, s in enumerate(proof["siblings"]):
+        sib = _node_bytes(lv, s["hash"])
+        node = hashlib.sha256(sib + node if s["side"] == "L" else node + sib).digest()
+    return hashlib.sha256(node).hexdigest()
+
+def verify(path: str | Path, proof: dict, root: str) -> bool:
+    """Rehashea solo `path` y comprueba que, con la prueba, reconstruye `root` (con o sin prefijo SHA256:)."""
+    sha = sha256_file(path)
+    if sha != proof["sha256"]:
+        return False
+    return root_from_proof(sha, proof) == root.split(":", 1)[-1]
+
+def hash_files(paths: list[str], workers: int | None = None) -> list[str]:
+    """SHA-256 de cada fichero, en el orden de `paths`. hashlib libera el GIL al
+    hashear bloques grandes, así que los hilos aprovechan todos los núcleos."""
+    workers = workers or min(32, os.cpu_count() or 1)
+    if workers <= 1 or len(paths) <= 1:
+        return [sha256_file(p) for p in paths]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(sha256_file, paths))
+
+# -------- Reutilización entre ejecuciones --------
+# Caché {path: [size, mtime_ns, inode, sha256]} junto al manifiesto: un fichero
+# cuyo stat no ha cambiado no se vuelve a leer. Es compartida por la ingesta, el
+# manifiesto de evidencias, el empaquetado y app.py, así que cada artefacto se lee
+# una sola vez aunque lo sellen varias etapas.
+
+HASH_CACHE_FILE = Path("evidence/hash_cache.json")
+
+def _cache_key(path: str | Path) -> str:
+    # rutas relativas al directorio de trabajo: app.py (absolutas) y los scripts comparten entradas
+    return os.path.relpath(os.path.abspath(path))
+
+def stat_key(path: str) -> list[int]:
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+def load_hash_cache(path: str | Path) -> dict:
+    try:
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def save_hash_cache(path: str | Path, cache: dict) -> None:
+    p = Path(path)
+    tmp = p.with_suffix(p.suffix + ".tmp")
+    tmp.write_text(json.dumps(cache, separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp, p)
+
+def hash_files_cached(paths: list[str], cache: dict, workers: int | None = None) -> tuple[list[str], int]:
+    """Como hash_files, pero solo lee los ficheros cuyo (size, mtime_ns, inode) no coincide con la
+    caché, que se actualiza in situ; se podan las entradas de ficheros que ya no existen.
+    Devuelve (hashes, ficheros rehasheados)."""
+    names = [_cache_key(p) for p in paths]
+    keys = [stat_key(p) for p in paths]
+    stale = [i for i, (n, k) in enumerate(zip(names, keys)) if cache.get(n, [None])[:3] != k]
+    fresh = hash_files([paths[i] for i in stale], workers)
+    for i, sha in zip(stale, fresh):
+        cache[names[i]] = keys[i] + [sha]
+    for n in [n for n in cache if n not in names and not os.path.exists(n)]:
+        del cache[n]
+    return [cache[n][3] for n in names], len(stale)
+
+def file_digests(paths: list[str | Path], cache_file: str | Path = HASH_CACHE_FILE,
+                 workers: int | None = None) -> dict[str, str]:
+    """{path: sha256} usando (y actualizando) la caché compartida en disco: punto de entrada
+    común para cualquier etapa que necesite el hash de un artefacto."""
+    paths = [str(p) for p in paths]
+    cache = load_hash_cache(cache_file)
+    hashes, n = hash_files_cached(paths, cache, workers)
+    if n:
+        Path(cache_file).parent.mkdir(parents=True, exist_ok=True)
+        save_hash_cache(cache_file, cache)
+    return dict(zip(paths, hashes))
+
+def remember_digests(entries: dict[str, tuple[list[int], str]], cache_file: str | Path = HASH_CACHE_FILE) -> None:
+    """Incorpora a la caché hashes calculados por otra etapa {path: (stat_key previo a la lectura, sha256)}."""
+    cache = load_hash_cache(cache_file)
+    for p, (key, sha) in entries.items():
+        cache[_cache_key(p)] = list(key) + [sha]
+    Path(cache_file).parent.mkdir(parents=True, exist_ok=True)
+    save_hash_cache(cache_file, cache)
+
+def build_manifest(artifacts: list[str], run_id: str, workers: int | None = None,
+                   previous: dict | None = None, hash_cache: dict | None = None) -> dict:
+    """Manifiesto con hashes, raíz y niveles del árbol.
+
+    Con `hash_cache` solo se rehashean los artefactos cuyo stat cambió; con el manifiesto
+    `previous` de la misma lista de artefactos solo se recalculan los caminos de las hojas que cambiaron.
+    """
+    if hash_cache is None:
+        hashes = hash_files(artifacts, workers)
+    else:
+        hashes, _ = hash_files_cached(artifacts, hash_cache, workers)
+    rows = [{"path": a, "sha256": sha} for a, sha in zip(artifacts, hashes)]
+    if previous and previous.get("merkle_tree") and [r["path"] for r in previous["artifacts"]] == artifacts:
+        tree = MerkleTree.from_manifest(previous)
+        old = [r["sha256"] for r in previous["artifacts"]]
+        tree.update({i: h for i, h in enumerate(hashes) if old[i] != h})
+    else:
+        tree = MerkleTree.from_hashes(artifacts, hashes)
+    return {"run_id": run_id, "artifacts": rows, "merkle_root": f"SHA256:{tree.root}",
+            "merkle_tree": tree.to_dict()}
+
+def build_proofs(manifest: dict) -> dict:
+    """{path: prueba de inclusión} para todos los artefactos del manifiesto."""
+    tree = MerkleTree.from_manifest(manifest)
+    return {"merkle_root": manifest["merkle_root"], "proofs": {p: tree.prove(p) for p in tree.index}}
+
+def main():
+    ap = argparse.ArgumentParser(description="Verifica la inclusión de un artefacto en el manifiesto de evidencias.")
+    ap.add_argument("path", help="artefacto a verificar (ruta tal como figura en el manifiesto)")
+    ap.add_argument("--proofs", default="evidence/proofs.json", help="fichero de pruebas de evidence_build.py")
+    ap.add_argument("--root", default=None, help="raíz esperada (por defecto, la del fichero de pruebas)")
+    args = ap.parse_args()
+
+    proofs = json.loads(Path(args.proofs).read_text(encoding="utf-8"))
+    proof = proofs["proofs"].get(args.path)
+    if proof is None:
+        raise SystemExit(f"{args.path} no tiene prueba en {args.proofs}")
+    ok = verify(args.path, proof, args.root or proofs["merkle_root"])
+    print(f"{args.path}: {'INCLUIDO' if ok else 'NO VERIFICA'} ({len(proof['siblings'])} hermanos)")
+    raise SystemExit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
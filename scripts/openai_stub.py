@@ -0,0 +1,76 @@
+import json, time, threading, argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Servidor local que imita POST /v1/chat/completions de OpenAI para probar
+# raga_compute.py sin coste ni red:
+#   python scripts/openai_stub.py --port 8089 --fail-every 3
+#   OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=stub \
+#       python scripts/raga_compute.py --concurrency 8 --tpm 200000
+
+ANSWER = {
+    "narrative": "Respuesta simulada por openai_stub.",
+    "compliance_check": "CUMPLE",
+    "citations": [],
+    "key_risk": "N/A"
+}
+
+class State:
+    lock = threading.Lock()
+    calls = 0
+
+def make_handler(fail_every: int, latency: float):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code: int, body: dict, headers: dict | None = None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                return self._send(404, {"error": {"message": "not found"}})
+            req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            with State.lock:
+                State.calls += 1
+                n = State.calls
+            # Cada `fail_every` llamadas se responde 429 para ejercitar el backoff
+            if fail_every and n % fail_every == 0:
+                return self._send(429, {"error": {"message": "rate limited (stub)", "type": "rate_limit_error"}},
+                                  {"retry-after": "0.05"})
+            time.sleep(latency)
+            # "echo" devuelve la línea DATO del prompt: permite comprobar a qué petición corresponde cada respuesta
+            prompt = " ".join(m.get("content", "") for m in req.get("messages", []))
+            dato = next((l.strip() for l in prompt.splitlines() if l.strip().startswith("DATO:")), "")
+            self._send(200, {
+                "id": f"chatcmpl-stub-{n}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": req.get("model", "stub"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": json.dumps({**ANSWER, "echo": dato}, ensure_ascii=False)},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+            })
+
+        def log_message(self, *args):
+            pass
+    return Handler
+
+def main():
+    ap = argparse.ArgumentParser(description="Stub local del endpoint chat/completions de OpenAI.")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--fail-every", type=int, default=0, help="responde 429 cada N llamadas (0 = nunca)")
+    ap.add_argument("--latency", type=float, default=0.2, help="segundos de espera por respuesta")
+    args = ap.parse_args()
+    srv = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.fail_every, args.latency))
+    print(f"openai_stub escuchando en http://127.0.0.1:{args.port}/v1")
+    srv.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,33 @@
-import zipfile
+import argparse
 from pathlib import Path
 from datetime import datetime
+from audit_zip import write_audit_zip
+from merkle import remember_digests
 
 ARTS = [
     "data/normalized/energy_2024-01.json",
     "data/normalized/hr_2024-01.json",
     "data/normalized/ethics_2024-01.json",
-    "ontology/validation.log","ontology/linaje.ttl",
+    "ontology/validation.log","ontology/linaje.ttl","ontology/linaje.nt","ontology/linaje.nt.gz",
     "raga/kpis.json","raga/explain.json",
     "ops/gate_report.json","eee/eee_report.json",
     "xbrl/informe.xbrl","xbrl/validation.log",
-    "evidence/evidence_manifest.json","evidence/tokens/2025Q1.tsr",
+    "evidence/evidence_manifest.json","evidence/proofs.json","evidence/tokens/2025Q1.tsr",
     "ops/slo_report.json","ops/hitl_kappa.json"
 ]
 
 def main():
+    ap = argparse.ArgumentParser(description="Empaqueta los artefactos de auditoría en un ZIP con SHA256SUMS.")
+    ap.add_argument("--workers", type=int, default=None, help="hilos de compresión (por defecto, núcleos disponibles)")
+    args = ap.parse_args()
+
     run_id = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}"
     out = Path(f"release/audit/STEELTRACE_LAB_{run_id}.zip")
     out.parent.mkdir(parents=True, exist_ok=True)
-    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as z:
-        for p in ARTS:
-            if Path(p).exists():
-                z.write(p)
+    arts = [p for p in ARTS if Path(p).exists()]
+    # compresión en paralelo; el SHA-256 de SHA256SUMS sale de la misma lectura y se comparte vía caché
+    digests = write_audit_zip(out, [(p, p) for p in arts], workers=args.workers)
+    remember_digests({p: (d["stat"], d["sha256"]) for p, d in digests.items()})
     print("ZIP listo:", out)
 
 if __name__ == "__main__":
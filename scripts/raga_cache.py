@@ -0,0 +1,53 @@
+import json, sqlite3, time
+from pathlib import Path
+from utils_hash import sha256_json
+
+# Caché persistente de deliberaciones LLM (SQLite). La clave es el hash canónico
+# del registro, las evidencias recuperadas y la plantilla/modelo del prompt:
+# si nada de eso cambia, la respuesta anterior sigue siendo válida.
+
+def cache_key(record: dict, context_chunks: list[dict], prompt: str, model: str, mode: str) -> str:
+    return sha256_json({
+        "record": record,
+        "evidence": [{"source": c["source"], "page": c["page"], "content": c["content"]} for c in context_chunks],
+        "prompt": prompt,
+        "model": model,
+        "mode": mode
+    })
+
+class DeliberationCache:
+    def __init__(self, path: str | Path, max_age_days: float | None = None, max_entries: int | None = None):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(path))
+        self.db.execute("""CREATE TABLE IF NOT EXISTS deliberations (
+            key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)""")
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.max_entries = max_entries
+
+    def get(self, key: str) -> dict | None:
+        row = self.db.execute("SELECT value, created FROM deliberations WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if self.max_age and row[1] < time.time() - self.max_age:
+            return None
+        self.db.execute("UPDATE deliberations SET accessed = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key: str, value: dict) -> None:
+        now = time.time()
+        self.db.execute("INSERT OR REPLACE INTO deliberations (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                        (key, json.dumps(value, ensure_ascii=False), now, now))
+
+    def evict(self) -> int:
+        """Elimina entradas caducadas y, si sobra, las menos usadas recientemente."""
+        before = self.db.total_changes
+        if self.max_age:
+            self.db.execute("DELETE FROM deliberations WHERE created < ?", (time.time() - self.max_age,))
+        if self.max_entries is not None:
+            self.db.execute("""DELETE FROM deliberations WHERE key NOT IN (
+                SELECT key FROM deliberations ORDER BY accessed DESC LIMIT ?)""", (self.max_entries,))
+        return self.db.total_changes - before
+
+    def close(self) -> None:
+        self.db.commit()
+        self.db.close()
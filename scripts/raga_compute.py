@@ -1,14 +1,22 @@
+import argparse
 import json
 import sys
 from pathlib import Path
 
 # Importar el cerebro
 sys.path.append(str(Path(__file__).parent.parent))
-from modules.gices_brain import retrieve_context, deliberative_analysis
+from modules.gices_brain import retrieve_context, deliberate_batch, PROMPT_TEMPLATE, MODEL
+from modules.knowledge_index import build_index, load_index, open_chunks
+from raga_cache import DeliberationCache, cache_key
+from kpi_registry import KPI_REGISTRY, compute_kpis, load_frames
 
 DATA_DIR = Path("data/normalized")
 RAGA_DIR = Path("raga")
-INDEX_FILE = Path("rag/index.json")
+CHUNKS_FILE = Path("rag/chunks.jsonl")
+INDEX_FILE = Path("rag/index.json")  # formato anterior (array JSON completo)
+BM25_FILE = Path("rag/bm25_index.json")
+CACHE_FILE = RAGA_DIR / "deliberation_cache.sqlite"
+MODE = "Academic Validation"
 
 def load_json(path):
     if path.exists():
@@ -16,56 +24,97 @@ def load_json(path):
     return []
 
 def main():
+    ap = argparse.ArgumentParser(description="Cálculo RAGA: KPIs deterministas y validación deliberativa.")
+    ap.add_argument("--concurrency", type=int, default=1,
+                    help="llamadas simultáneas al LLM (1 = secuencial)")
+    ap.add_argument("--tpm", type=int, default=None,
+                    help="presupuesto de tokens por minuto para el LLM (sin límite por defecto)")
+    ap.add_argument("--no-cache", action="store_true",
+                    help="ignora la caché de deliberaciones y llama siempre al LLM")
+    ap.add_argument("--cache-max-age-days", type=float, default=90,
+                    help="antigüedad máxima de una entrada de caché")
+    ap.add_argument("--cache-max-entries", type=int, default=100_000,
+                    help="entradas máximas en caché (se expulsan las menos usadas)")
+    args = ap.parse_args()
+
     print("⚙️ Iniciando Cálculo RAGA...")
     RAGA_DIR.mkdir(exist_ok=True)
     
     # 1. Cargar Datos Normalizados
     # Primero ejecutamos mcp_ingest (paso previo en el pipeline), aquí leemos el resultado
-    energy_data = load_json(DATA_DIR / "energy_2024-01.json")
     biodiv_data = load_json(DATA_DIR / "biodiversity_2024.json") # El dato nuevo
     
     kpis = {}
     explanations = {}
 
-    # --- A. Lógica Determinista (Energía) ---
-    if energy_data:
-        total_co2 = sum(r["kwh"] * 0.23 for r in energy_data) / 1000
-        kpis["E1-1.co2e"] = total_co2
-        explanations["E1-1"] = {"narrative": "Cálculo aritmético directo (kWh * Factor)."}
+    # --- A. Lógica Determinista (registro de KPIs E1/S1/G1, vectorizado) ---
+    totals, by_entity = compute_kpis(load_frames(DATA_DIR))
+    kpis.update(totals)
+    for k in KPI_REGISTRY:
+        if k["id"] in totals:
+            ex = explanations.setdefault(k["id"].split(".")[0], {
+                "narrative": "Cálculo aritmético directo (registro de KPIs, agregado por company_id y period).",
+                "formulas": {}
+            })
+            ex["formulas"][k["id"]] = f"{k['narrative']} [{k['unit']}]"
 
     # --- B. Lógica Deliberativa (Biodiversidad) ---
     if biodiv_data:
         print("🦋 Dato de Biodiversidad detectado. Activando Validación Académica...")
         
-        # Cargar Conocimiento (Fase 0)
-        knowledge_base = load_json(INDEX_FILE)
+        # Cargar Conocimiento (Fase 0): acceso perezoso al JSONL, solo offsets en memoria
+        knowledge_base = open_chunks(CHUNKS_FILE) or load_json(INDEX_FILE)
         if not knowledge_base:
             print("⚠️ Advertencia: No hay base de conocimiento. Ejecuta ingest_knowledge.py primero.")
             knowledge_base = []
 
-        # Procesar cada registro de biodiversidad
+        # Índice BM25 persistido por ingest_knowledge.py (si falta, se construye una vez)
+        bm25 = load_index(BM25_FILE)
+        if bm25 is None or bm25["n_docs"] != len(knowledge_base):
+            bm25 = build_index(knowledge_base)
+
+        # 1. Recuperar Evidencia (RAGA) para cada registro de biodiversidad
+        contexts = []
         for i, record in enumerate(biodiv_data):
-            kpi_id = f"E4-5.project_{i+1}"
-            kpis[kpi_id] = record["ecosystem_area_ha"]
-            
-            # 1. Recuperar Evidencia (RAGA)
+            kpis[f"E4-5.project_{i+1}"] = record["ecosystem_area_ha"]
             query = f"nature credits restoration integrity {record.get('project_type', '')} {record.get('financial_risk_exposure', '')}"
-            context = retrieve_context(query, knowledge_base)
-            
-            # 2. Deliberar (AI)
-            analysis = deliberative_analysis(record, [c["content"] for c in context])
-            
-            # 3. Guardar Explicación Estructurada
-            explanations[kpi_id] = {
+            contexts.append(retrieve_context(query, knowledge_base, index=bm25))
+
+        # 2. Deliberar (AI): primero la caché; solo los fallos van al LLM,
+        #    en paralelo y con límite de tokens/minuto. El orden se conserva.
+        cache = None if args.no_cache else DeliberationCache(
+            CACHE_FILE, max_age_days=args.cache_max_age_days, max_entries=args.cache_max_entries)
+        keys = [cache_key(r, c, PROMPT_TEMPLATE, MODEL, MODE) for r, c in zip(biodiv_data, contexts)]
+        analyses = [cache.get(k) if cache else None for k in keys]
+        misses = [i for i, a in enumerate(analyses) if a is None]
+        fresh = deliberate_batch([(biodiv_data[i], contexts[i]) for i in misses],
+                                 concurrency=args.concurrency, tpm=args.tpm, mode=MODE)
+        for i, analysis in zip(misses, fresh):
+            analyses[i] = analysis
+            # No se cachean errores (sin API key, fallos de red, JSON inválido...)
+            if cache and analysis.get("compliance_check") not in ("ERROR", "FAIL"):
+                cache.put(keys[i], analysis)
+        if cache:
+            cache.evict()
+            cache.close()
+        print(f"   Deliberaciones: {len(keys) - len(misses)} desde caché, {len(misses)} al LLM")
+
+        # 3. Guardar Explicación Estructurada
+        missed = set(misses)
+        for i, (context, analysis) in enumerate(zip(contexts, analyses)):
+            explanations[f"E4-5.project_{i+1}"] = {
                 "type": "deliberative_validation",
                 "narrative": analysis.get("narrative"),
                 "compliance": analysis.get("compliance_check"),
-                "evidence_used": [c["source"] for c in context]
+                "evidence_used": [c["source"] for c in context],
+                "cache": "disabled" if cache is None else ("miss" if i in missed else "hit"),
+                "cache_key": keys[i]
             }
 
     # Guardar Resultados
     (RAGA_DIR / "kpis.json").write_text(json.dumps(kpis, indent=2, ensure_ascii=False))
     (RAGA_DIR / "explain.json").write_text(json.dumps(explanations, indent=2, ensure_ascii=False))
+    (RAGA_DIR / "kpis_by_entity.json").write_text(json.dumps(by_entity, indent=2, ensure_ascii=False))
     
     print("✅ RAGA Compute Finalizado.")
 
@@ -1,111 +1,753 @@
-import json
+import json, argparse, gzip, hashlib, heapq, os, pickle, tempfile
 from pathlib import Path
-from datetime import datetime
-from rdflib import Graph, Namespace, Literal, RDF, XSD, URIRef
+from datetime import datetime, date
+from decimal import Decimal
+from itertools import islice
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+import re
+import numpy as np
+import pandas as pd
+from rdflib import BNode, Graph, Namespace, Literal, RDF, RDFS, XSD, URIRef
+from rdflib.namespace import SH
 from pyshacl import validate
+from graph_cache import load_graph
+from utils_hash import sha256_file, sha256_json
+from pyshacl.rdfutil import stringify_node
+from pyshacl.rdfutil.compare import compare_literal
 
 ROOT = Path(".")
 ONTOLOGY_FILE = ROOT / "ontology" / "esrs.owl"
 SHACL_E1 = ROOT / "contracts" / "shacl_e1.ttl"
 SHACL_S1 = ROOT / "contracts" / "shacl_s1.ttl"
 SHACL_G1 = ROOT / "contracts" / "shacl_g1.ttl"
+SHAPES = {"E1": SHACL_E1, "S1": SHACL_S1, "G1": SHACL_G1}
 OUT_VALIDATION = ROOT / "ontology" / "validation.log"
 OUT_LINEAGE    = ROOT / "ontology" / "linaje.ttl"
+OUT_LINEAGE_NT = ROOT / "ontology" / "linaje.nt"
+OUT_LINEAGE_GZ = ROOT / "ontology" / "linaje.nt.gz"
+LINEAGE_FILE   = ROOT / "data" / "lineage.jsonl"
+INCREMENTAL_CACHE = ROOT / "ontology" / ".shacl_incremental"
 
 EX = Namespace("http://example.com/esrs#")
 
 def _load_json(path: Path):
     return json.loads(path.read_text(encoding="utf-8"))
 
-def _add_evidence(g: Graph, subj: URIRef, ev_path: str):
-    ev = URIRef(str(subj) + "/evidence/1")
-    g.add((subj, EX.hasEvidence, ev))
-    g.add((ev, RDF.type, EX.Evidencia))
-    g.add((ev, EX.evidencePath, Literal(ev_path, datatype=XSD.string)))
+# Especificación de materialización por estándar: clase RDF, base del sujeto
+# y (campo JSON, propiedad, datatype) de cada literal
+RECORD_SPECS = {
+    "E1": {"cls": EX.E1Record, "base": "http://example.com/esrs#E1Record/", "fields": [
+        ("company_id", EX.companyId, XSD.string),
+        ("period_start", EX.periodStart, XSD.date),
+        ("period_end", EX.periodEnd, XSD.date),
+        ("kwh", EX.kwh, XSD.decimal),
+        ("emission_factor_co2e", EX.emissionFactor, XSD.decimal),
+    ]},
+    "S1": {"cls": EX.S1Record, "base": "http://example.com/esrs#S1Record/", "fields": [
+        ("company_id", EX.companyId, XSD.string),
+        ("period", EX.period, XSD.string),
+        ("employees_start", EX.employeesStart, XSD.integer),
+        ("employees_end", EX.employeesEnd, XSD.integer),
+        ("exits", EX.exits, XSD.integer),
+    ]},
+    "G1": {"cls": EX.G1Record, "base": "http://example.com/esrs#G1Record/", "fields": [
+        ("company_id", EX.companyId, XSD.string),
+        ("period", EX.period, XSD.string),
+        ("cases_opened", EX.casesOpened, XSD.integer),
+        ("cases_closed", EX.casesClosed, XSD.integer),
+        ("closed_with_resolution", EX.closedWithResolution, XSD.integer),
+    ]},
+}
+# dominio de data/lineage.jsonl (catálogo de mcp_ingest) → estándar ESRS
+DOMAIN_STANDARDS = {"energy": "E1", "hr": "S1", "ethics": "G1"}
+BATCH_SIZE = 50_000  # tripletas por llamada a Graph.addN
+SHARD_SIZE = 10_000  # registros por shard en la validación particionada
+
+def record_base(std: str, path: Path) -> str:
+    """Base de los sujetos de un normalizado: una por fichero, para que periodos y filiales
+    del mismo estándar no colisionen (…#E1Record/energy_2024-01/1)."""
+    return f"{RECORD_SPECS[std]['base']}{Path(path).stem}/"
+
+def evidence_path(path: Path) -> str:
+    return f"data/normalized/{Path(path).name}"
+
+def discover_inputs(lineage: Path = LINEAGE_FILE) -> dict[str, list[Path]]:
+    """{estándar: [normalizados]} de todos los ficheros de data/lineage.jsonl, agrupados por dominio.
+    Sin linaje, los data/normalized/<dominio>_*.json (como kpi_registry.normalized_inputs)."""
+    found = {std: set() for std in RECORD_SPECS}
+    if lineage.exists():
+        for line in lineage.read_text(encoding="utf-8").splitlines():
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            std = DOMAIN_STANDARDS.get(row.get("domain"))
+            if std and row.get("normalized"):
+                found[std].add(Path(row["normalized"]))
+    else:
+        for domain, std in DOMAIN_STANDARDS.items():
+            found[std].update((ROOT / "data" / "normalized").glob(f"{domain}_*.json"))
+    return {std: sorted(paths) for std, paths in found.items()}
+
+def iter_record_triples(records, spec: dict, ev_path: str, start: int = 1, indices=None, base: str | None = None):
+    """Genera las tripletas de cada registro (+ su evidencia) reutilizando términos repetidos.
+
+    Los sujetos son `base` (por defecto la del estándar) + número, desde `start` o con
+    `indices` (uno por registro) si se indican.
+    """
+    cls, fields = spec["cls"], spec["fields"]
+    base = base or spec["base"]
+    ev_lit = Literal(ev_path, datatype=XSD.string)
+    literals = {}
+    numbered = zip(indices, records) if indices is not None else enumerate(records, start=start)
+    for i, r in numbered:
+        subj = URIRef(f"{base}{i}")
+        yield subj, RDF.type, cls
+        for k, prop, dtype in fields:
+            if k not in r:
+                continue
+            v = r[k]
+            key = (dtype, type(v), v)
+            try:
+                lit = literals.get(key)
+            except TypeError:  # valor no hashable (lista/objeto): sin caché
+                key, lit = None, None
+            if lit is None:
+                lit = Literal(v, datatype=dtype)
+                if key is not None:
+                    literals[key] = lit
+            yield subj, prop, lit
+        ev = URIRef(f"{base}{i}/evidence/1")
+        yield subj, EX.hasEvidence, ev
+        yield ev, RDF.type, EX.Evidencia
+        yield ev, EX.evidencePath, ev_lit
+
+def add_triples(g: Graph, triples) -> None:
+    """Carga en lotes con Graph.addN en vez de un g.add por tripleta."""
+    triples = iter(triples)
+    while True:
+        batch = list(islice(triples, BATCH_SIZE))
+        if not batch:
+            return
+        g.addN((s, p, o, g) for s, p, o in batch)
+
+def _nt_term(term) -> str:
+    # Literal.n3() usa comillas triples para cadenas multilínea (válido en Turtle, no en N-Triples)
+    if isinstance(term, Literal):
+        lex = str(term).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n").replace("\r", "\\r")
+        if term.language:
+            return f'"{lex}"@{term.language}'
+        return f'"{lex}"^^<{term.datatype}>' if term.datatype else f'"{lex}"'
+    return term.n3()
+
+def iter_ntriples(triples):
+    """Líneas N-Triples de las tripletas, serializando una vez cada término repetido."""
+    cache = {}
+    for t in triples:
+        parts = []
+        for term in t:
+            s = cache.get(term)
+            if s is None:
+                s = _nt_term(term)
+                if len(cache) < BATCH_SIZE:  # sujetos únicos no deben inflar la caché
+                    cache[term] = s
+            parts.append(s)
+        yield f"{parts[0]} {parts[1]} {parts[2]} .\n"
+
+def write_ntriples(triples, out) -> int:
+    """Vuelca las tripletas como N-Triples a un fichero de texto abierto; devuelve cuántas escribió."""
+    n = 0
+    lines = iter_ntriples(triples)
+    while True:
+        batch = list(islice(lines, BATCH_SIZE))
+        if not batch:
+            return n
+        out.writelines(batch)
+        n += len(batch)
+
+def _file_triples(data_path: Path, standard: str):
+    return iter_record_triples(_load_json(data_path), RECORD_SPECS[standard], evidence_path(data_path),
+                               base=record_base(standard, data_path))
+
+def materialize(g: Graph, data_path: Path, standard: str):
+    add_triples(g, _file_triples(data_path, standard))
+
+def materialize_nt(out, data_path: Path, standard: str) -> int:
+    """Como materialize, pero escribe N-Triples en `out` sin pasar por un Graph."""
+    return write_ntriples(_file_triples(data_path, standard), out)
 
 def materialize_e1(g: Graph, data_path: Path):
-    records = _load_json(data_path)
-    for i, r in enumerate(records, start=1):
-        subj = URIRef(f"http://example.com/esrs#E1Record/{i}")
-        g.add((subj, RDF.type, EX.E1Record))
-        if "company_id" in r: g.add((subj, EX.companyId, Literal(r["company_id"], datatype=XSD.string)))
-        if "period_start" in r: g.add((subj, EX.periodStart, Literal(r["period_start"], datatype=XSD.date)))
-        if "period_end" in r: g.add((subj, EX.periodEnd, Literal(r["period_end"], datatype=XSD.date)))
-        if "kwh" in r: g.add((subj, EX.kwh, Literal(r["kwh"], datatype=XSD.decimal)))
-        if "emission_factor_co2e" in r: g.add((subj, EX.emissionFactor, Literal(r["emission_factor_co2e"], datatype=XSD.decimal)))
-        _add_evidence(g, subj, ev_path=f"data/normalized/{data_path.name}")
+    materialize(g, data_path, "E1")
 
 def materialize_s1(g: Graph, data_path: Path):
-    records = _load_json(data_path)
-    for i, r in enumerate(records, start=1):
-        subj = URIRef(f"http://example.com/esrs#S1Record/{i}")
-        g.add((subj, RDF.type, EX.S1Record))
-        for k, prop, dtype in [
-            ("company_id", EX.companyId, XSD.string),
-            ("period", EX.period, XSD.string),
-            ("employees_start", EX.employeesStart, XSD.integer),
-            ("employees_end", EX.employeesEnd, XSD.integer),
-            ("exits", EX.exits, XSD.integer),
-        ]:
-            if k in r: g.add((subj, prop, Literal(r[k], datatype=dtype)))
-        _add_evidence(g, subj, ev_path=f"data/normalized/{data_path.name}")
+    materialize(g, data_path, "S1")
 
 def materialize_g1(g: Graph, data_path: Path):
-    records = _load_json(data_path)
-    for i, r in enumerate(records, start=1):
-        subj = URIRef(f"http://example.com/esrs#G1Record/{i}")
-        g.add((subj, RDF.type, EX.G1Record))
-        for k, prop, dtype in [
-            ("company_id", EX.companyId, XSD.string),
-            ("period", EX.period, XSD.string),
-            ("cases_opened", EX.casesOpened, XSD.integer),
-            ("cases_closed", EX.casesClosed, XSD.integer),
-            ("closed_with_resolution", EX.closedWithResolution, XSD.integer),
-        ]:
-            if k in r: g.add((subj, prop, Literal(r[k], datatype=dtype)))
-        _add_evidence(g, subj, ev_path=f"data/normalized/{data_path.name}")
+    materialize(g, data_path, "G1")
 
 def run_shacl(data_graph: Graph, shape_path: Path, title: str) -> tuple[bool, str]:
-    sh = Graph(); sh.parse(shape_path, format="turtle")
-    conforms, _, results_text = validate(
+    sh = load_graph(shape_path)
+    _, results_graph, _ = validate(
         data_graph=data_graph, shacl_graph=sh,
         inference="rdfs", abort_on_first=False,
         allow_infos=True, allow_warnings=True
     )
-    header = f"=== {title} ===\nconforms = {conforms}\n"
-    return conforms, header + results_text + "\n"
+    # mismo formato de informe que el resto de modos: validation.log no depende de los flags
+    rows = result_rows(results_graph, results_graph.subjects(RDF.type, SH.ValidationResult))
+    return _titled_section(title, rows)
 
-def main():
-    OUT_VALIDATION.parent.mkdir(parents=True, exist_ok=True)
+def load_combined_shapes(paths: dict) -> tuple[Graph, dict]:
+    """Une los shapes de cada estándar en un grafo y devuelve {shape → estándar} (incluye property shapes)."""
+    sh, owner = Graph(), {}
+    for std, path in paths.items():
+        part = load_graph(path)
+        # pyshacl escribe las rutas de los mensajes con los prefijos del grafo de shapes:
+        # los mismos que al validar cada estándar por separado
+        for prefix, ns in part.namespaces():
+            sh.bind(prefix, ns, replace=True)
+        for node in part.subjects(RDF.type, SH.NodeShape):
+            owner[node] = std
+            for prop in part.objects(node, SH.property):
+                owner[prop] = std
+        sh += part
+    return sh, owner
+
+_NS = Graph(); _NS.bind("ex", EX); _NS.bind("sh", SH); _NS.bind("xsd", XSD)
+
+def _short(term) -> str:
+    # Prefijos fijos: el texto no depende de los bind del grafo de resultados
+    if term is None:
+        return "-"
+    try:
+        return _NS.namespace_manager.normalizeUri(term) if isinstance(term, URIRef) else str(term)
+    except Exception:
+        return str(term)
+
+def shape_text(graph: Graph, shape) -> str:
+    """Shape de origen como lo escribe pyshacl: las property shapes son nodos en blanco y se
+    muestran con sus restricciones ("[ sh:datatype xsd:decimal ; sh:path ex:kwh ]"), con los
+    prefijos fijos de _NS. Igual desde el grafo de shapes que desde la copia del informe."""
+    if not isinstance(shape, BNode):
+        return _short(shape)
+    g = Graph()
+    g.namespace_manager = _NS.namespace_manager
+    pending, seen = [shape], set()
+    while pending:
+        node = pending.pop()
+        if node in seen:
+            continue
+        seen.add(node)
+        for p, o in graph.predicate_objects(node):
+            g.add((node, p, o))
+            if isinstance(o, BNode):
+                pending.append(o)
+    return stringify_node(g, shape)
+
+def _result_text(component, severity, shape, focus, path, value, message) -> str:
+    name = re.split(r"[#/]", str(component))[-1]
+    return (f"Constraint Violation in {name} ({component}):\n"
+            f"\tSeverity: {_short(severity)}\n"
+            f"\tSource Shape: {shape}\n"
+            f"\tFocus Node: {_short(focus)}\n"
+            f"\tResult Path: {_short(path)}\n"
+            + (f"\tValue Node: {value.n3()}\n" if value is not None else "")
+            + f"\tMessage: {message or ''}\n")
+
+ROW_FORMAT = 2  # versión del texto de cada fila: forma parte de la clave de la caché incremental
+
+def result_rows(results_graph: Graph, results) -> list[tuple]:
+    """(focus, path, component, texto, es_violación) por resultado; tuplas de str/bool, serializables entre procesos."""
+    rows = []
+    for r in results:
+        get = lambda p: results_graph.value(r, p)
+        focus, path, component = get(SH.focusNode), get(SH.resultPath), get(SH.sourceConstraintComponent)
+        rows.append((
+            str(focus), str(path), str(component),
+            _result_text(component, get(SH.resultSeverity), shape_text(results_graph, get(SH.sourceShape)),
+                         focus, path, get(SH.value), get(SH.resultMessage)),
+            get(SH.resultSeverity) == SH.Violation,
+        ))
+    return rows
+
+def format_results(rows: list) -> tuple[bool, str]:
+    """Texto de informe al estilo de pyshacl, ordenado para que sea determinista."""
+    conforms = not any(row[-1] for row in rows)
+    rows = sorted(rows)
+    return conforms, (f"Validation Report\nConforms: {conforms}\nResults ({len(rows)}):\n"
+                      + "".join(row[3] for row in rows))
+
+def _titled_section(title: str, rows: list) -> tuple[bool, str]:
+    conforms, text = format_results(rows)
+    return conforms, f"=== {title} ===\nconforms = {conforms}\n" + text + "\n"
+
+def _section(std: str, rows: list) -> tuple[bool, str]:
+    return _titled_section(f"SHACL {std}", rows)
+
+def run_shacl_combined(data_graph: Graph, shape_paths: dict) -> dict:
+    """Una sola pasada de pyshacl (cierre RDFS calculado una vez) con todos los shapes.
+
+    Devuelve {estándar: (conforms, texto)} reconstruido a partir del sh:sourceShape
+    de cada resultado, con el mismo formato de sección que run_shacl.
+    """
+    sh, owner = load_combined_shapes(shape_paths)
+    _, results_graph, _ = validate(
+        data_graph=data_graph, shacl_graph=sh,
+        inference="rdfs", abort_on_first=False,
+        allow_infos=True, allow_warnings=True
+    )
+    by_std = {std: [] for std in shape_paths}
+    for r in results_graph.subjects(RDF.type, SH.ValidationResult):
+        std = owner.get(results_graph.value(r, SH.sourceShape))
+        if std is None:  # shape anidado: se asigna por la clase del nodo foco
+            focus = str(results_graph.value(r, SH.focusNode))
+            std = next((k for k, spec in RECORD_SPECS.items() if focus.startswith(spec["base"])), None)
+        if std in by_std:
+            by_std[std].append(r)
+    return {std: _section(std, result_rows(results_graph, results)) for std, results in by_std.items()}
 
+# -------- Validación particionada --------
+# Cada shape apunta a una única clase (E1Record/S1Record/G1Record) y sus
+# restricciones solo miran propiedades directas del nodo foco, así que cada
+# shard de registros se valida de forma independiente y el resultado es el mismo.
+
+@lru_cache(maxsize=1)
+def _ontology_graph() -> Graph:
+    return load_graph(ONTOLOGY_FILE) if ONTOLOGY_FILE.exists() else Graph()
+
+@lru_cache(maxsize=None)
+def _shapes_graph(path: str) -> Graph:
+    return load_graph(path)
+
+def validate_shard(std: str, records: list, start: int, ev_path: str, indices=None,
+                   base: str | None = None) -> list[tuple]:
+    """Materializa un shard (numerado desde `start` o con `indices`) y lo valida contra los shapes de su estándar."""
     g = Graph()
-    if ONTOLOGY_FILE.exists():
-        g.parse(ONTOLOGY_FILE, format="turtle")
+    g += _ontology_graph()
+    add_triples(g, iter_record_triples(records, RECORD_SPECS[std], ev_path, start=start, indices=indices, base=base))
+    _, results_graph, _ = validate(
+        data_graph=g, shacl_graph=_shapes_graph(str(SHAPES[std])),
+        inference="rdfs", abort_on_first=False,
+        allow_infos=True, allow_warnings=True
+    )
+    return result_rows(results_graph, results_graph.subjects(RDF.type, SH.ValidationResult))
+
+def run_shacl_partitioned(inputs: dict, workers: int, shard_size: int = SHARD_SIZE) -> dict:
+    """Valida {estándar: [normalizados]} por shards en un pool de procesos; devuelve {estándar: (conforms, texto)}."""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for std, paths in inputs.items():
+            for path in paths:
+                records = _load_json(path)
+                ev_path, base = evidence_path(path), record_base(std, path)
+                for a in range(0, len(records), shard_size):
+                    futures.append((std, pool.submit(validate_shard, std, records[a:a + shard_size], a + 1,
+                                                     ev_path, None, base)))
+        rows = {std: [] for std in inputs}
+        for std, fut in futures:
+            rows[std].extend(fut.result())
+    return {std: _section(std, r) for std, r in rows.items()}
+
+# -------- Validador nativo (subconjunto SHACL simple) --------
+# Los shapes que publicamos solo usan sh:minCount, sh:datatype, sh:minInclusive y
+# sh:pattern sobre propiedades directas. Para ese subconjunto se evalúan las
+# columnas del JSON normalizado sin construir el grafo RDF: cada restricción se
+# calcula una vez por valor distinto, con la misma semántica de Literal/pyshacl,
+# y se propaga a la columna como máscara booleana. Cualquier otra cosa (shapes
+# más ricos, ontología que infiera tipos, nulos explícitos, NaN/inf) devuelve None
+# y el llamador recurre a pyshacl.
+
+NATIVE_NODE_PREDICATES = {RDF.type, SH.targetClass, SH.property}
+NATIVE_PROPERTY_PREDICATES = {SH.path, SH.minCount, SH.datatype, SH.minInclusive, SH.pattern}
+# clase Python que pyshacl exige en Literal.value para cada sh:datatype
+NATIVE_VALUE_TYPES = {XSD.string: str, XSD.integer: int, XSD.decimal: Decimal, XSD.date: date}
+
+def _shape_labels(shapes: Graph, ps, path) -> dict:
+    # textos que pyshacl toma del grafo de shapes (y de sus prefijos)
+    return {"shape": shape_text(shapes, ps), "path": stringify_node(shapes, path)}
+
+def compile_native_shapes(shapes: Graph, ontology: Graph) -> dict | None:
+    """{estándar: [(prop, campo, {restricción: valor}, textos)]} si todos los shapes caben en el subconjunto; si no, None."""
+    by_cls = {spec["cls"]: std for std, spec in RECORD_SPECS.items()}
+    compiled = {}
+    for node in shapes.subjects(RDF.type, SH.NodeShape):
+        if set(shapes.predicates(node)) - NATIVE_NODE_PREDICATES:
+            return None
+        targets = list(shapes.objects(node, SH.targetClass))
+        if len(targets) != 1 or targets[0] not in by_cls:
+            return None
+        cls, std = targets[0], by_cls[targets[0]]
+        # la inferencia RDFS no debe poder añadir ni quitar nodos foco
+        if any(ontology.subjects(RDFS.subClassOf, cls)) or any(ontology.subjects(RDFS.domain, cls)):
+            return None
+        fields = {prop: (k, dtype) for k, prop, dtype in RECORD_SPECS[std]["fields"]}
+        props = []
+        for ps in shapes.objects(node, SH.property):
+            preds = list(shapes.predicates(ps))
+            if set(preds) - NATIVE_PROPERTY_PREDICATES or len(preds) != len(set(preds)):
+                return None
+            path = shapes.value(ps, SH.path)
+            if not isinstance(path, URIRef) or any(ontology.subjects(RDFS.subPropertyOf, path)):
+                return None
+            cons = {p: shapes.value(ps, p) for p in preds if p != SH.path}
+            if path == EX.hasEvidence:
+                if set(cons) - {SH.minCount}:
+                    return None
+                props.append((path, None, cons, _shape_labels(shapes, ps, path)))
+                continue
+            if path not in fields:
+                return None
+            k, dtype = fields[path]
+            if SH.datatype in cons and cons[SH.datatype] not in NATIVE_VALUE_TYPES:
+                return None
+            if SH.minInclusive in cons and not isinstance(cons[SH.minInclusive], Literal):
+                return None
+            props.append((path, k, cons, _shape_labels(shapes, ps, path)))
+        compiled.setdefault(std, []).extend(props)
+    return compiled
+
+def _literal_checks(lit: Literal, cons: dict) -> tuple[bool, bool, bool]:
+    """(datatype, minInclusive, pattern) fallidos para un literal, con la semántica de pyshacl."""
+    bad_dt = bad_min = bad_pat = False
+    if SH.datatype in cons:
+        dt = cons[SH.datatype]
+        bad_dt = lit.datatype != dt or lit.ill_typed is True or not isinstance(lit.value, NATIVE_VALUE_TYPES[dt])
+    if SH.minInclusive in cons:
+        lo = cons[SH.minInclusive]
+        if isinstance(lit.value, str) != isinstance(lo.value, str):
+            bad_min = True
+        else:
+            try:
+                bad_min = not compare_literal(lit, lo) >= 0
+            except (TypeError, NotImplementedError):
+                bad_min = True
+    if SH.pattern in cons:
+        bad_pat = re.search(str(cons[SH.pattern]), str(lit)) is None
+    return bad_dt, bad_min, bad_pat
+
+def _value_checks(vals: pd.Series, dtype, cons: dict) -> np.ndarray | None:
+    """Matriz (n, 3) de fallos por valor. Cada valor distinto se evalúa una vez (por tipo
+    Python, para no mezclar 1, 1.0 y True) y se propaga con factorize; None si no es hashable."""
+    out = np.zeros((len(vals), 3), dtype=bool)
+    types = vals.map(type).to_numpy()
+    for t in pd.unique(types):
+        idx = np.flatnonzero(types == t)
+        try:
+            codes, uniques = pd.factorize(vals.iloc[idx])
+        except TypeError:
+            return None
+        table = np.array([_literal_checks(Literal(u, datatype=dtype), cons) for u in uniques], dtype=bool)
+        out[idx] = table[codes]
+    return out
+
+def native_validate(std: str, props: list, records: list, ev_path: str, start: int = 1,
+                    indices=None, base: str | None = None) -> list[tuple] | None:
+    """Filas de resultado (mismo formato que result_rows) o None si los datos requieren pyshacl."""
+    spec = RECORD_SPECS[std]
+    base = base or spec["base"]
+    df = pd.DataFrame(records, dtype=object)  # NaN = clave ausente, None = null explícito
+    n = len(df)
+    numbers = indices if indices is not None else range(start, start + n)
+    focus = np.array([f"{base}{i}" for i in numbers], dtype=object)
+    dtypes = {k: dtype for k, _, dtype in spec["fields"]}
+    rows = []
+
+    def emit(mask, path, component, message, values=None, dtype=None):
+        # `labels` son los de la property shape del bucle en curso
+        for i in np.flatnonzero(mask):
+            value = Literal(values[i], datatype=dtype) if values is not None else None
+            node = URIRef(focus[i])
+            rows.append((focus[i], str(path), str(component),
+                         _result_text(component, SH.Violation, labels["shape"], node, path, value,
+                                      message.replace("{focus}", node.n3()).replace("{path}", labels["path"])),
+                         True))
 
-    e1 = ROOT / "data" / "normalized" / "energy_2024-01.json"
-    s1 = ROOT / "data" / "normalized" / "hr_2024-01.json"
-    g1 = ROOT / "data" / "normalized" / "ethics_2024-01.json"
-    for p in [e1, s1, g1]:
-        if not p.exists():
-            raise SystemExit(f"No existe {p}. Ejecuta primero mcp_ingest.py")
+    for path, k, cons, labels in props:
+        if k is None:  # ex:hasEvidence: la materialización siempre añade una evidencia
+            min_count = int(cons.get(SH.minCount, 0))
+            if min_count > 1:
+                emit(np.ones(n, dtype=bool), path, SH.MinCountConstraintComponent,
+                     f"Less than {min_count} values on {{focus}}->{{path}}")
+            continue
+        col = df[k] if k in df.columns else pd.Series(np.nan, index=df.index, dtype=object)
+        arr = col.to_numpy()
+        if np.equal(arr, None).any():
+            return None
+        # presencia según la clave, no según notna(): un NaN/inf explícito (válido para
+        # JSON Schema "number") es un valor que pyshacl evalúa, no una clave ausente
+        present = np.fromiter((k in r for r in records), dtype=bool, count=n)
+        floats = np.fromiter((isinstance(v, float) for v in arr), dtype=bool, count=n) & present
+        if floats.any() and not np.isfinite(arr[floats].astype(float)).all():
+            return None
+        dtype = dtypes[k]
+        if SH.minCount in cons:
+            min_count = int(cons[SH.minCount])
+            emit(present.astype(int) < min_count, path, SH.MinCountConstraintComponent,
+                 f"Less than {min_count} values on {{focus}}->{{path}}")
+        checks = _value_checks(col[present], dtype, cons)
+        if checks is None:
+            return None
+        fail = np.zeros((n, 3), dtype=bool)
+        fail[present] = checks
+        if SH.datatype in cons:
+            emit(fail[:, 0], path, SH.DatatypeConstraintComponent,
+                 f"Value is not Literal with datatype {_short(cons[SH.datatype])}", arr, dtype)
+        if SH.minInclusive in cons:
+            emit(fail[:, 1], path, SH.MinInclusiveConstraintComponent,
+                 f"Value is not >= {stringify_node(_NS, cons[SH.minInclusive])}", arr, dtype)
+        if SH.pattern in cons:
+            emit(fail[:, 2], path, SH.PatternConstraintComponent,
+                 f"Value does not match pattern '{cons[SH.pattern]}'", arr, dtype)
+    return rows
+
+def run_shacl_native(inputs: dict, shape_paths: dict, ontology: Graph) -> dict:
+    """{estándar: (conforms, texto) | None}; None donde hay que recurrir a pyshacl."""
+    out = {}
+    for std, shape_path in shape_paths.items():
+        compiled = compile_native_shapes(_shapes_graph(str(shape_path)), ontology)
+        rows = None
+        if compiled is not None and set(compiled) <= {std}:
+            rows = []
+            for path in inputs[std]:
+                part = native_validate(std, compiled.get(std, []), _load_json(path), evidence_path(path),
+                                       base=record_base(std, path))
+                if part is None:
+                    rows = None
+                    break
+                rows += part
+        out[std] = _section(std, rows) if rows is not None else None
+    return out
+
+# -------- Revalidación incremental --------
+# Las restricciones son locales a cada registro, así que un registro que no ha
+# cambiado conserva sus resultados. Por normalizado se guarda su hash (el de
+# data/lineage.jsonl), un hash por registro y las filas de resultado; si el fichero
+# cambia solo se rematerializan y validan los registros nuevos o distintos.
+# Cambiar shapes u ontología invalida la caché de los ficheros de ese estándar.
+
+def lineage_hashes(path: Path = LINEAGE_FILE) -> dict:
+    """{normalizado: sha256} según data/lineage.jsonl (la última fila de cada fichero gana)."""
+    out = {}
+    if path.exists():
+        for line in path.read_text(encoding="utf-8").splitlines():
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if row.get("normalized") and row.get("normalized_sha256"):
+                out[Path(row["normalized"]).as_posix()] = row["normalized_sha256"]
+    return out
+
+def validate_records(std: str, records: list, indices: list, ev_path: str, use_native: bool = False,
+                     base: str | None = None) -> list[tuple]:
+    """Valida registros sueltos (sujetos numerados con `indices`): nativo si se puede, si no pyshacl."""
+    if use_native:
+        compiled = compile_native_shapes(_shapes_graph(str(SHAPES[std])), _ontology_graph())
+        if compiled is not None and set(compiled) <= {std}:
+            rows = native_validate(std, compiled.get(std, []), records, ev_path, indices=indices, base=base)
+            if rows is not None:
+                return rows
+    return validate_shard(std, records, 1, ev_path, indices=indices, base=base)
+
+def _load_incremental(path: Path) -> dict | None:
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except Exception:
+        return None
+
+def _incremental_file(std: str, path: Path, hashes: dict, ontology_sha: str | None, use_native: bool,
+                      cache_dir: Path) -> tuple[list, int]:
+    """(filas, registros revalidados) de un normalizado, con su propia entrada de caché."""
+    ev_path, base = evidence_path(path), record_base(std, path)
+    key = sha256_json({"shapes": sha256_file(SHAPES[std]), "ontology": ontology_sha,
+                       "ev_path": ev_path, "base": base, "format": ROW_FORMAT})
+    st = path.stat()
+    stat = (st.st_size, st.st_mtime_ns)
+    cache_file = cache_dir / f"{std}_{path.stem}.pkl"
+    cached = _load_incremental(cache_file)
+    if cached is None or cached["key"] != key:
+        cached = {"key": key, "sha256": None, "stat": None, "digests": [], "rows": []}
+    file_sha = hashes.get(path.as_posix())
+    if file_sha is None or cached.get("stat") != stat:
+        file_sha = sha256_file(path)  # sin fila de linaje o editado después de la ingesta
+    if cached["sha256"] == file_sha:
+        return cached["rows"], 0
+    records = _load_json(path)
+    digests = [sha256_json(r) for r in records]
+    old = cached["digests"]
+    changed = [i for i, d in enumerate(digests) if i >= len(old) or old[i] != d]
+    stale = set(changed)
+    rows = [row for row in cached["rows"]
+            if (i := int(row[0][len(base):]) - 1) < len(records) and i not in stale]
+    if changed:
+        rows += validate_records(std, [records[i] for i in changed], [i + 1 for i in changed],
+                                 ev_path, use_native, base=base)
+    tmp = cache_file.with_suffix(f".tmp{os.getpid()}")
+    with open(tmp, "wb") as f:
+        pickle.dump({"key": key, "sha256": file_sha, "stat": stat, "digests": digests, "rows": rows}, f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, cache_file)
+    return rows, len(changed)
+
+def run_shacl_incremental(inputs: dict, use_native: bool = False, cache_dir: Path = INCREMENTAL_CACHE) -> dict:
+    """{estándar: (conforms, texto)} revalidando solo los registros que cambiaron desde la última
+    ejecución. Cada normalizado (periodo, filial) tiene su entrada de caché: reenviar un fichero
+    solo revalida los registros distintos de ese fichero."""
+    hashes = lineage_hashes()
+    ontology_sha = sha256_file(ONTOLOGY_FILE) if ONTOLOGY_FILE.exists() else None
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    live = {cache_dir / f"{std}_{p.stem}.pkl" for std, paths in inputs.items() for p in paths}
+    for old in cache_dir.glob("*.pkl"):  # ficheros que ya no están en el linaje
+        if old not in live:
+            old.unlink(missing_ok=True)
+    out = {}
+    for std, paths in inputs.items():
+        rows, n_changed = [], 0
+        for path in paths:
+            file_rows, n = _incremental_file(std, path, hashes, ontology_sha, use_native, cache_dir)
+            rows += file_rows
+            n_changed += n
+        print(f"SHACL incremental {std}: {n_changed} registros revalidados en {len(paths)} ficheros")
+        out[std] = _section(std, rows)
+    return out
+
+# -------- Linaje en streaming --------
+# linaje.ttl obliga a tener todo el grafo en memoria y el serializador Turtle de
+# rdflib es lento. linaje.nt se escribe tripleta a tripleta; linaje.nt.gz es la
+# forma canónica (N-Triples ordenado, sin duplicados, gzip con mtime=0): mismo
+# contenido → mismos bytes, y se ordena por runs en disco con memoria acotada.
+
+def lineage_triples(inputs: dict):
+    """Tripletas del linaje en el orden de materialización: ontología y después cada estándar."""
+    yield from _ontology_graph()
+    for std, paths in inputs.items():
+        for path in paths:
+            yield from _file_triples(path, std)
+
+def write_lineage_nt(inputs: dict, out_path: Path) -> int:
+    """linaje.nt en streaming, en el mismo orden que lineage_triples: ontología y después
+    cada normalizado con materialize_nt (ningún Graph de registros en memoria)."""
+    with open(out_path, "w", encoding="utf-8", newline="\n") as f:
+        n = write_ntriples(_ontology_graph(), f)
+        for std, paths in inputs.items():
+            for path in paths:
+                n += materialize_nt(f, path, std)
+    return n
+
+def write_lineage_sorted(triples, out_path: Path, run_size: int = 4 * BATCH_SIZE) -> tuple[int, str]:
+    """Escribe N-Triples ordenado y deduplicado en gzip; devuelve (tripletas, sha256 del N-Triples sin comprimir)."""
+    h = hashlib.sha256()
+    n = 0
+    lines = iter_ntriples(triples)
+    with tempfile.TemporaryDirectory(dir=out_path.parent) as tmp:
+        runs = []
+        while True:
+            run = sorted(set(islice(lines, run_size)))
+            if not run:
+                break
+            path = Path(tmp) / f"run_{len(runs):05d}.nt"
+            path.write_text("".join(run), encoding="utf-8")
+            runs.append(path)
+        files = [open(p, encoding="utf-8", newline="\n") for p in runs]
+        try:
+            with open(out_path, "wb") as raw, gzip.GzipFile(filename="", mode="wb", fileobj=raw, mtime=0) as gz:
+                prev = None
+                for line in heapq.merge(*files):
+                    if line == prev:
+                        continue
+                    prev = line
+                    data = line.encode("utf-8")
+                    gz.write(data)
+                    h.update(data)
+                    n += 1
+        finally:
+            for f in files:
+                f.close()
+    return n, h.hexdigest()
+
+def main():
+    ap = argparse.ArgumentParser(description="Validación SHACL de los normalizados E1/S1/G1 + linaje RDF.")
+    ap.add_argument("--combined", action="store_true",
+                    help="une los shapes y valida en una sola pasada (inferencia RDFS una vez)")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="procesos para validar por estándar y shard de registros (1 = sin particionar)")
+    ap.add_argument("--shard-size", type=int, default=SHARD_SIZE,
+                    help="registros por shard en la validación particionada")
+    ap.add_argument("--native", action="store_true",
+                    help="evalúa los shapes simples directamente sobre el JSON (pyshacl para el resto)")
+    ap.add_argument("--verify-native", action="store_true",
+                    help="con --native, valida también con pyshacl y falla si los resultados difieren")
+    ap.add_argument("--lineage", nargs="+", choices=["ttl", "nt", "nt.gz"], default=["ttl"],
+                    help="formatos del linaje: ttl (linaje.ttl), nt (streaming) y/o nt.gz (ordenado, canónico)")
+    ap.add_argument("--incremental", action="store_true",
+                    help="revalida solo los registros cambiados (hashes de data/lineage.jsonl) y reutiliza el resto")
+    args = ap.parse_args()
+
+    OUT_VALIDATION.parent.mkdir(parents=True, exist_ok=True)
 
-    materialize_e1(g, e1)
-    materialize_s1(g, s1)
-    materialize_g1(g, g1)
+    # todos los periodos y filiales ingeridos (data/lineage.jsonl), agrupados por estándar
+    inputs = discover_inputs()
+    for std, paths in inputs.items():
+        if not paths:
+            raise SystemExit(f"No hay normalizados de {std}. Ejecuta primero mcp_ingest.py")
+        for p in paths:
+            if not p.exists():
+                raise SystemExit(f"No existe {p}. Ejecuta primero mcp_ingest.py")
+    if args.incremental:
+        sections, native, pending = run_shacl_incremental(inputs, use_native=args.native), {}, {}
+    else:
+        sections = {}
+        native = run_shacl_native(inputs, SHAPES, _ontology_graph()) if args.native else {}
+        pending = {std: path for std, path in SHAPES.items() if native.get(std) is None}
 
-    results = []
-    c1, t1 = run_shacl(g, SHACL_E1, "SHACL E1")
-    c2, t2 = run_shacl(g, SHACL_S1, "SHACL S1")
-    c3, t3 = run_shacl(g, SHACL_G1, "SHACL G1")
+    # El grafo completo solo hace falta para pyshacl en un proceso o para linaje.ttl
+    g = None
+    if "ttl" in args.lineage or (args.verify_native and native) or (pending and args.workers <= 1):
+        g = Graph()
+        if ONTOLOGY_FILE.exists():
+            load_graph(ONTOLOGY_FILE, into=g)
+        for std, paths in inputs.items():
+            for path in paths:
+                materialize(g, path, std)
+    if args.native and not args.incremental:
+        print("SHACL nativo:", ", ".join(std for std in SHAPES if std not in pending) or "-",
+              "| pyshacl:", ", ".join(pending) or "-")
+    if args.verify_native and native:
+        # comparación diferencial: mismo formato de filas en ambos caminos
+        reference = run_shacl_combined(g, SHAPES)
+        diff = [std for std, sec in native.items() if sec is not None and sec != reference[std]]
+        if diff:
+            raise SystemExit(f"El validador nativo difiere de pyshacl en: {', '.join(diff)}")
+    if pending and args.workers > 1:
+        sections = run_shacl_partitioned({std: inputs[std] for std in pending}, args.workers, args.shard_size)
+    elif pending and args.combined:
+        sections = run_shacl_combined(g, pending)
+    elif pending:
+        sections = {std: run_shacl(g, path, f"SHACL {std}") for std, path in pending.items()}
+    sections = {std: native.get(std) or sections[std] for std in SHAPES}
+    ok = all(c for c, _ in sections.values())
 
     ts = datetime.utcnow().isoformat() + "Z"
-    report = f"[{ts}] GLOBAL_CONFORMS = {all([c1,c2,c3])}\n\n" + t1 + "\n" + t2 + "\n" + t3
+    report = f"[{ts}] GLOBAL_CONFORMS = {ok}\n\n" + "\n".join(t for _, t in sections.values())
     OUT_VALIDATION.write_text(report, encoding="utf-8")
-    g.serialize(destination=OUT_LINEAGE, format="turtle")
 
-    print("SHACL GLOBAL:", "OK" if all([c1,c2,c3]) else "CONSTRAINTS FAILED")
+    print("SHACL GLOBAL:", "OK" if ok else "CONSTRAINTS FAILED")
     print(f"- Reporte: {OUT_VALIDATION}")
-    print(f"- Linaje RDF: {OUT_LINEAGE}")
+    # evidence_build.py sella los linajes que existan: los de ejecuciones anteriores
+    # con otros --lineage ya no corresponden a este validation.log
+    for fmt, out in {"ttl": OUT_LINEAGE, "nt": OUT_LINEAGE_NT, "nt.gz": OUT_LINEAGE_GZ}.items():
+        if fmt not in args.lineage:
+            out.unlink(missing_ok=True)
+    if "ttl" in args.lineage:
+        g.serialize(destination=OUT_LINEAGE, format="turtle")
+        print(f"- Linaje RDF: {OUT_LINEAGE}")
+    if "nt" in args.lineage:
+        n = write_lineage_nt(inputs, OUT_LINEAGE_NT)
+        print(f"- Linaje N-Triples: {OUT_LINEAGE_NT} ({n} tripletas)")
+    if "nt.gz" in args.lineage:
+        n, digest = write_lineage_sorted(lineage_triples(inputs), OUT_LINEAGE_GZ)
+        print(f"- Linaje canónico: {OUT_LINEAGE_GZ} ({n} tripletas, sha256 N-Triples {digest})")
 
 if __name__ == "__main__":
     main()
@@ -1,12 +1,20 @@
 import hashlib, json
 from pathlib import Path
 
+HASH_BUFFER = 1 << 20  # bytes leídos por iteración al hashear ficheros
+
 def sha256_bytes(data: bytes) -> str:
     return hashlib.sha256(data).hexdigest()
 
 def sha256_file(path: str | Path) -> str:
-    p = Path(path)
-    return sha256_bytes(p.read_bytes())
+    # Lectura en bloques sobre un búfer fijo: memoria constante con ficheros de varios GB
+    h = hashlib.sha256()
+    buf = bytearray(HASH_BUFFER)
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
+        while n := f.readinto(buf):
+            h.update(view[:n])
+    return h.hexdigest()
 
 def sha256_json(obj) -> str:
     # canonical JSON for stable hash
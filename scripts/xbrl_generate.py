@@ -1,43 +1,180 @@
 from pathlib import Path
-import json
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+import hashlib, json, math, re, argparse
 from lxml import etree
 
 KPI_FILE = Path("raga/kpis.json")
 OUT_XML  = Path("xbrl/informe.xbrl")
 XSD_FILE = Path("xbrl/schema/basic_xbrl.xsd")
 VAL_LOG  = Path("xbrl/validation.log")
+KPI_BY_ENTITY_FILE = Path("raga/kpis_by_entity.json")
+BATCH_DIR = Path("xbrl/batch")
 
-def build_xml(entity="ACME", period="2024-01"):
-    ns = {"x": "http://example.com/xbrl"}
-    root = etree.Element("{http://example.com/xbrl}Report", version="0.1")
-    etree.SubElement(root, "{http://example.com/xbrl}Entity").text = entity
-    etree.SubElement(root, "{http://example.com/xbrl}Period").text = period
-    kpis = json.loads(KPI_FILE.read_text(encoding="utf-8"))
-    for k, v in kpis.items():
-        kpi = etree.SubElement(root, "{http://example.com/xbrl}KPI")
-        etree.SubElement(kpi, "{http://example.com/xbrl}Id").text = k
-        etree.SubElement(kpi, "{http://example.com/xbrl}Value").text = str(v)
-        # opcional: unidad por KPI si quieres
-        # etree.SubElement(kpi, "{http://example.com/xbrl}Unit").text = "tCO2e"  # etc.
-    return root
+NS = "http://example.com/xbrl"
+XSI = "http://www.w3.org/2001/XMLSchema-instance"
+MAX_LOGGED_ERRORS = 100  # errores de esquema volcados en validation.log
+
+def _q(tag: str) -> str:
+    return f"{{{NS}}}{tag}"
+
+@lru_cache(maxsize=None)
+def compiled_schema(xsd_path: str = str(XSD_FILE)) -> etree.XMLSchema:
+    """XSD parseado y compilado una sola vez por proceso."""
+    return etree.XMLSchema(etree.parse(xsd_path))
+
+def iter_kpis(path: Path = KPI_FILE):
+    """(id, valor) de cada KPI de raga/kpis.json, en orden."""
+    yield from json.loads(path.read_text(encoding="utf-8")).items()
+
+def _is_nil(v) -> bool:
+    return v is None or (isinstance(v, float) and math.isnan(v))
+
+def write_report(out_path: Path, facts, entity: str, period: str) -> int:
+    """Escribe el informe en streaming (etree.xmlfile): cada KPI se vuelca según llega
+    de `facts` (pares id, valor o ternas id, valor, unidad) sin construir el árbol. Devuelve cuántos escribió.
+    Un valor nulo o NaN (KPI sin datos) se escribe como <Value xsi:nil="true"/>, nunca como texto."""
+    n = 0
+    with etree.xmlfile(str(out_path), encoding="utf-8") as xf:
+        xf.write_declaration()
+        with xf.element(_q("Report"), {"version": "0.1"}, nsmap={None: NS, "xsi": XSI}):
+            xf.write("\n  ")
+            with xf.element(_q("Entity")):
+                xf.write(entity)
+            xf.write("\n  ")
+            with xf.element(_q("Period")):
+                xf.write(period)
+            for fact in facts:
+                k, v, unit = (*fact, None)[:3]
+                xf.write("\n  ")
+                with xf.element(_q("KPI")):
+                    with xf.element(_q("Id")):
+                        xf.write(str(k))
+                    if _is_nil(v):
+                        with xf.element(_q("Value"), {f"{{{XSI}}}nil": "true"}):
+                            pass
+                    else:
+                        with xf.element(_q("Value")):
+                            xf.write(str(v))
+                    if unit is not None:
+                        with xf.element(_q("Unit")):
+                            xf.write(str(unit))
+                n += 1
+            xf.write("\n")
+    return n
 
 def validate_xml(xml_tree):
-    schema_doc = etree.parse(str(XSD_FILE))
-    schema = etree.XMLSchema(schema_doc)
+    schema = compiled_schema()
     return schema.validate(xml_tree), schema.error_log
 
+def validate_file(path: Path, schema: etree.XMLSchema | None = None):
+    """Valida el fichero contra el XSD mientras se parsea (iterparse), liberando cada KPI ya
+    validado: memoria acotada aunque el informe tenga cientos de miles de hechos."""
+    schema = schema or compiled_schema()
+    # el log de errores de libxml2 es global y acumulativo: sin limpiarlo, el informe
+    # de un fichero arrastraría los errores de los validados antes en el mismo proceso
+    etree.clear_error_log()
+    try:
+        for _, el in etree.iterparse(str(path), events=("end",), tag=_q("KPI"), schema=schema):
+            el.clear()
+            while el.getprevious() is not None:
+                del el.getparent()[0]
+    except etree.XMLSyntaxError as e:
+        return False, e.error_log
+    return True, None
+
+def _format_errors(errors) -> str:
+    lines = [str(e) for e in list(errors)[:MAX_LOGGED_ERRORS]]
+    if len(errors) > MAX_LOGGED_ERRORS:
+        lines.append(f"... {len(errors) - MAX_LOGGED_ERRORS} errores más")
+    return "\n".join(lines)
+
+def report_scope(kpis_by_entity: dict) -> tuple[str, str]:
+    """(entidad, periodo) del informe consolidado según los datos: las entidades del grupo
+    unidas con "+" y el periodo, o el intervalo "primero/último" si abarca varios."""
+    entities = sorted(str(e) for e in kpis_by_entity)
+    periods = sorted({str(p) for per in kpis_by_entity.values() for p in per})
+    if not entities or not periods:
+        raise ValueError("sin KPIs por entidad y periodo: ejecuta primero raga_compute.py")
+    period = periods[0] if len(periods) == 1 else f"{periods[0]}/{periods[-1]}"
+    return "+".join(entities), period
+
+# -------- Lote multi-entidad / multi-periodo --------
+
+def _safe_name(s) -> str:
+    # si hay que sustituir caracteres se añade un hash corto del valor original: "A/B" y "A_B"
+    # no pueden acabar en el mismo fichero
+    s = str(s)
+    safe = re.sub(r"[^\w.-]", "_", s)
+    return safe if safe == s else f"{safe}-{hashlib.sha256(s.encode('utf-8')).hexdigest()[:8]}"
+
+def report_path(out_dir: Path, entity: str, period: str) -> Path:
+    return out_dir / f"{_safe_name(entity)}_{_safe_name(period)}.xbrl"
+
+def generate_one(entity: str, period: str, facts: list, out_path: str) -> dict:
+    """Escribe y valida un informe (entidad, periodo). Se ejecuta en el pool; el XSD compilado
+    se reutiliza entre los informes del mismo worker."""
+    n = write_report(Path(out_path), facts, entity=entity, period=period)
+    ok, errors = validate_file(Path(out_path))
+    return {"entity": entity, "period": period, "path": out_path, "facts": n, "ok": ok,
+            "errors": "" if ok else _format_errors(errors)}
+
+def _generate_one_task(args):
+    return generate_one(*args)
+
+def generate_batch(kpis_by_entity: dict, out_dir: Path = BATCH_DIR, workers: int = 1) -> list[dict]:
+    """Un informe por par (entidad, periodo) de {entidad: {periodo: {kpi: valor}}}, en orden estable."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tasks = [(entity, period, list(kpis.items()), str(report_path(out_dir, entity, period)))
+             for entity, periods in sorted(kpis_by_entity.items())
+             for period, kpis in sorted(periods.items())]
+    seen = {}
+    for entity, period, _, path in tasks:
+        if path in seen:  # p. ej. ("A_1", "B") y ("A", "1_B")
+            raise ValueError(f"{(entity, period)} y {seen[path]} escribirían el mismo informe {path}")
+        seen[path] = (entity, period)
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(_generate_one_task, tasks, chunksize=max(1, len(tasks) // (4 * workers))))
+    return [_generate_one_task(t) for t in tasks]
+
+def batch_log(results: list[dict]) -> str:
+    failed = [r for r in results if not r["ok"]]
+    lines = [f"XBRL batch: {len(results)} informes, {len(results) - len(failed)} OK, {len(failed)} FAILED"]
+    for r in results:
+        lines.append(f"{'OK    ' if r['ok'] else 'FAILED'} {r['entity']} {r['period']} ({r['facts']} hechos) → {r['path']}")
+    for r in failed:
+        lines.append(f"\n=== {r['entity']} {r['period']} ===\n{r['errors']}")
+    return "\n".join(lines) + "\n"
+
 def main():
+    ap = argparse.ArgumentParser(description="Generación y validación XBRL del informe de KPIs.")
+    ap.add_argument("--batch", action="store_true",
+                    help="un informe por (entidad, periodo) desde raga/kpis_by_entity.json")
+    ap.add_argument("--kpis", default=str(KPI_BY_ENTITY_FILE), help="KPIs por entidad y periodo (informes del --batch; entidad y periodo del consolidado)")
+    ap.add_argument("--out-dir", default=str(BATCH_DIR), help="directorio de salida del modo --batch")
+    ap.add_argument("--workers", type=int, default=1, help="procesos para generar informes en paralelo")
+    args = ap.parse_args()
+
+    if args.batch:
+        kpis_by_entity = json.loads(Path(args.kpis).read_text(encoding="utf-8"))
+        results = generate_batch(kpis_by_entity, Path(args.out_dir), args.workers)
+        log = Path(args.out_dir) / "validation.log"
+        log.write_text(batch_log(results), encoding="utf-8")
+        n_failed = sum(not r["ok"] for r in results)
+        print(f"XBRL batch: {len(results) - n_failed}/{len(results)} OK. See", log)
+        return
+
+    entity, period = report_scope(json.loads(Path(args.kpis).read_text(encoding="utf-8")))
     OUT_XML.parent.mkdir(parents=True, exist_ok=True)
-    xml = build_xml()
-    tree = etree.ElementTree(xml)
-    ok, errors = validate_xml(tree)
-    tree.write(str(OUT_XML), encoding="utf-8", xml_declaration=True, pretty_print=True)
+    write_report(OUT_XML, iter_kpis(), entity=entity, period=period)
+    ok, errors = validate_file(OUT_XML)
 
     if ok:
         VAL_LOG.write_text("XBRL basic schema validation: OK\n", encoding="utf-8")
         print("XBRL OK →", OUT_XML)
     else:
-        VAL_LOG.write_text("XBRL validation: FAILED\n" + str(errors), encoding="utf-8")
+        VAL_LOG.write_text("XBRL validation: FAILED\n" + _format_errors(errors), encoding="utf-8")
         print("XBRL FAILED. See", VAL_LOG)
 
 if __name__ == "__main__":
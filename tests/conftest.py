@@ -0,0 +1,29 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+# los scripts se importan entre sí por nombre de módulo (python scripts/x.py)
+sys.path.insert(0, str(ROOT / "scripts"))
+sys.path.insert(1, str(ROOT))  # paquete modules/
+
+@pytest.fixture
+def repo_root(monkeypatch):
+    """Ejecuta el test desde la raíz del repo: los scripts usan rutas relativas (contracts/, ontology/)."""
+    monkeypatch.chdir(ROOT)
+    return ROOT
+
+def pytest_addoption(parser):
+    parser.addoption("--runslow", action="store_true", help="incluye los tests marcados como slow")
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: test lento o que necesita mucho disco (solo con --runslow)")
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--runslow"):
+        return
+    skip = pytest.mark.skip(reason="test lento: usa --runslow")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip)
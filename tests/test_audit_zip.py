@@ -0,0 +1,113 @@
+import hashlib, os, shutil, struct, subprocess, zipfile
+
+import pytest
+
+import audit_zip
+from audit_zip import ZIP64_LIMIT, write_audit_zip
+
+BIG = ZIP64_LIMIT + (256 << 20)  # > 4 GiB: tamaños y offsets en ZIP64
+
+def _sha(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _read_back(zip_path, name):
+    # ZipExtFile comprueba el CRC-32 al llegar al final del miembro
+    h, n = hashlib.sha256(), 0
+    with zipfile.ZipFile(zip_path) as z, z.open(name) as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+            n += len(chunk)
+    return h.hexdigest(), n
+
+def _sparse(path, size):
+    with open(path, "wb") as f:
+        f.truncate(size)
+    return path
+
+def test_round_trip_deflated_stored_and_extra(tmp_path):
+    (tmp_path / "a.json").write_text('{"k": "' + "x" * 100_000 + '"}', encoding="utf-8")
+    (tmp_path / "b.log").write_bytes(os.urandom(300_000))
+    (tmp_path / "c.nt.gz").write_bytes(os.urandom(50_000))
+    (tmp_path / "vacío.txt").write_bytes(b"")
+    members = [(tmp_path / n, f"dir/{n}") for n in ("a.json", "b.log", "c.nt.gz", "vacío.txt")]
+    out = tmp_path / "audit.zip"
+
+    digests = write_audit_zip(out, members, extra={"manifest.json": b"{}"}, workers=3)
+
+    with zipfile.ZipFile(out) as z:
+        assert z.testzip() is None
+        info = {i.filename: i for i in z.infolist()}
+        assert list(info) == [a for _, a in members] + ["manifest.json", "SHA256SUMS"]
+        assert info["dir/a.json"].compress_type == zipfile.ZIP_DEFLATED
+        assert info["dir/a.json"].compress_size < info["dir/a.json"].file_size
+        assert info["dir/c.nt.gz"].compress_type == zipfile.ZIP_STORED  # ya comprimido: sin recomprimir
+        assert z.read("manifest.json") == b"{}"
+        for path, arcname in members:
+            assert z.read(arcname) == path.read_bytes()
+            assert digests[str(path)]["sha256"] == _sha(path)
+        sums = dict(reversed(line.split("  ", 1)) for line in z.read("SHA256SUMS").decode().splitlines())
+        assert sums == {a: _sha(p) for p, a in members}
+    if shutil.which("unzip"):
+        assert subprocess.run(["unzip", "-tq", str(out)], capture_output=True).returncode == 0
+
+def test_duplicate_member_is_rejected_and_nothing_is_left(tmp_path):
+    (tmp_path / "a.json").write_text("{}", encoding="utf-8")
+    out = tmp_path / "audit.zip"
+    with pytest.raises(ValueError):
+        write_audit_zip(out, [(tmp_path / "a.json", "a.json"), (tmp_path / "a.json", "a.json")])
+    assert not out.exists() and not (tmp_path / "audit.zip.tmp").exists()
+
+def _zip64_extra(info):
+    # campo extra 0x0001 del directorio central: tamaños/offset de 64 bits
+    tag, size = struct.unpack_from("<HH", info.extra)
+    return tag == 1 and size >= 8
+
+def test_zip64_records_with_lowered_threshold(tmp_path, monkeypatch):
+    # con el umbral rebajado los mismos registros ZIP64 que a partir de 4 GiB, en milisegundos
+    monkeypatch.setattr(audit_zip, "ZIP64_LIMIT", 4096)
+    (tmp_path / "big.gz").write_bytes(os.urandom(20_000))
+    (tmp_path / "big.bin").write_bytes(os.urandom(20_000))
+    (tmp_path / "small.json").write_text('{"ok": true}', encoding="utf-8")
+    members = [(tmp_path / n, n) for n in ("big.gz", "big.bin", "small.json")]
+    out = tmp_path / "z64.zip"
+
+    digests = write_audit_zip(out, members, workers=2)
+
+    assert b"PK\x06\x06" in out.read_bytes() and b"PK\x06\x07" in out.read_bytes()  # EOCD64 + localizador
+    with zipfile.ZipFile(out) as z:
+        assert z.testzip() is None
+        info = {i.filename: i for i in z.infolist()}
+        assert info["big.gz"].compress_type == zipfile.ZIP_STORED and _zip64_extra(info["big.gz"])
+        assert info["big.bin"].compress_type == zipfile.ZIP_DEFLATED and _zip64_extra(info["big.bin"])
+        assert info["small.json"].header_offset > 4096 and _zip64_extra(info["small.json"])
+        for path, name in members:
+            assert z.read(name) == path.read_bytes()
+            assert digests[str(path)]["sha256"] == _sha(path)
+    if shutil.which("unzip"):
+        assert subprocess.run(["unzip", "-tq", str(out)], capture_output=True).returncode == 0
+
+@pytest.mark.slow
+@pytest.mark.skipif(shutil.disk_usage("/tmp").free < 3 * BIG, reason="requiere ~13 GiB libres")
+def test_round_trip_members_over_4gib(tmp_path):
+    # ficheros dispersos: ocupan poco en disco y se leen deprisa
+    stored = _sparse(tmp_path / "big.gz", BIG)      # primero: el siguiente offset ya supera 4 GiB
+    deflated = _sparse(tmp_path / "big.bin", BIG)
+    small = tmp_path / "small.json"
+    small.write_text('{"ok": true}', encoding="utf-8")
+    out = tmp_path / "big.zip"
+
+    digests = write_audit_zip(out, [(stored, "big.gz"), (deflated, "big.bin"), (small, "small.json")],
+                              workers=2, level=1)
+
+    with zipfile.ZipFile(out) as z:
+        info = {i.filename: i for i in z.infolist()}
+        assert info["big.gz"].file_size == BIG and info["big.gz"].compress_type == zipfile.ZIP_STORED
+        assert info["big.bin"].file_size == BIG and info["big.bin"].compress_type == zipfile.ZIP_DEFLATED
+        assert info["small.json"].header_offset > ZIP64_LIMIT
+        assert z.read("small.json") == small.read_bytes()
+    for path, name in ((stored, "big.gz"), (deflated, "big.bin")):
+        assert _read_back(out, name) == (digests[str(path)]["sha256"], BIG)
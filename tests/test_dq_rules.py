@@ -0,0 +1,106 @@
+import math, random, re
+from datetime import datetime
+
+import pytest
+
+from mcp_ingest import compile_rules, dq_counts, is_date_iso, is_yyyy_mm, records_frame, within_month
+
+# Evaluación por fila original (apply_rule antes del motor compilado): la referencia
+# que las reglas compiladas deben reproducir registro a registro.
+def apply_rule(row: dict, rule: dict, domain: str) -> bool:
+    name = rule.get("rule")
+    field = rule.get("field")
+    if name == "not_null":
+        return row.get(field) is not None
+    if name == "is_date":
+        return is_date_iso(str(row.get(field, "")))
+    if name == "is_yyyy_mm":
+        return is_yyyy_mm(str(row.get(field, "")))
+    if name == ">=0":
+        try:
+            val = row.get(field)
+            if val is None: return False
+            return float(val) >= 0
+        except Exception:
+            return False
+    if name and name.startswith("within_month("):
+        m = re.search(r"within_month\('([^']+)'\)", name)
+        month = m.group(1) if m else ""
+        return within_month(str(row.get(field, "")), month)
+    if name and name.startswith("equals("):
+        m = re.search(r"equals\('([^']+)'\)", name)
+        ref = m.group(1) if m else ""
+        return str(row.get(field, "")) == ref
+    if name == "period_start <= period_end":
+        try:
+            ps = datetime.strptime(row.get("period_start"), "%Y-%m-%d")
+            pe = datetime.strptime(row.get("period_end"), "%Y-%m-%d")
+            return ps <= pe
+        except Exception:
+            return False
+    if name == "employees_end <= employees_start + 1000":
+        try:
+            return int(row.get("employees_end", 0)) <= int(row.get("employees_start", 0)) + 1000
+        except Exception:
+            return False
+    if name == "closed_with_resolution <= cases_closed":
+        try:
+            return int(row.get("closed_with_resolution", 0)) <= int(row.get("cases_closed", 0))
+        except Exception:
+            return False
+    return True
+
+FIELDS = ["kwh", "period_start", "period_end", "period", "employees_start", "employees_end",
+          "cases_closed", "closed_with_resolution"]
+RULES = {
+    "completeness": [{"field": f, "rule": "not_null"} for f in FIELDS],
+    "validity": [{"field": "period_start", "rule": "is_date"}, {"field": "period", "rule": "is_yyyy_mm"}]
+                + [{"field": f, "rule": ">=0"} for f in FIELDS],
+    "consistency": [{"rule": "period_start <= period_end"},
+                    {"rule": "employees_end <= employees_start + 1000"},
+                    {"rule": "closed_with_resolution <= cases_closed"}],
+    "timeliness": [{"field": "period_end", "rule": "within_month('2024-01')"},
+                   {"field": "period", "rule": "equals('2024-01')"}],
+}
+ABSENT = object()
+NUMBERS = [0, 1, 7, -3, 1000, 1001, 2.5, -0.5, 1e3, float("nan"), float("inf"), -float("inf"),
+           True, False, "12", " 5", "1_000", "7.0", "x", "", None, ABSENT,
+           2**53 + 1, 2**53, 10**20, 10**20 + 1, -(10**20), 2**63, 2**62 + 999]
+TEXTS = ["2024-01", "2024-01-15", "2024-01-31", "2024-02-01", "9999-12-31", "0001-01-01", "2024-13-01",
+         "None", "nan", "", 202401, 1.5, float("nan"), None, ABSENT]
+
+def _random_records(rng, n):
+    pools = {f: (TEXTS if f.startswith("period") else NUMBERS) for f in FIELDS}
+    rows = []
+    for _ in range(n):
+        row = {}
+        for f, pool in pools.items():
+            v = rng.choice(pool)
+            if v is not ABSENT:
+                row[f] = v
+        rows.append(row)
+    return rows
+
+@pytest.mark.parametrize("seed", range(5))
+def test_compiled_rules_match_per_row_apply_rule(seed):
+    records = _random_records(random.Random(seed), 400)
+    compiled = compile_rules(RULES)
+    counts = dq_counts(records_frame(records), compiled)
+    for (_, rule, pred), passed in zip(compiled, counts):
+        mask = pred(records_frame(records))
+        expected = [apply_rule(r, rule, "test") for r in records]
+        assert mask.tolist() == expected, rule
+        assert passed == sum(expected), rule
+
+def test_big_integers_are_compared_exactly():
+    records = [{"closed_with_resolution": 10**20 + 1, "cases_closed": 10**20},
+               {"closed_with_resolution": 10**20, "cases_closed": 10**20},
+               {"employees_end": 2**53 + 1001, "employees_start": 2**53}]
+    compiled = compile_rules({"consistency": RULES["consistency"][1:]})
+    masks = [pred(records_frame(records)).tolist() for _, _, pred in compiled]
+    assert masks == [[True, True, False], [False, True, True]]
+
+def test_nan_is_not_null_but_missing_is():
+    df = records_frame([{"kwh": math.nan}, {"kwh": None}, {}])
+    (_, _, pred), = compile_rules({"completeness": [{"field": "kwh", "rule": "not_null"}]})
+    assert pred(df).tolist() == [True, False, False]
@@ -0,0 +1,48 @@
+import json, threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("openai")
+pytest.importorskip("fitz")
+from openai import OpenAI
+
+import openai_stub
+from modules import gices_brain as gb
+
+@pytest.fixture
+def stub(monkeypatch):
+    """openai_stub en un puerto efímero: 429 (Retry-After 0.05 s) cada 3 llamadas."""
+    openai_stub.State.calls = 0
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), openai_stub.make_handler(fail_every=3, latency=0.0))
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{srv.server_address[1]}/v1"
+    monkeypatch.setattr(gb, "client", OpenAI(api_key="stub", base_url=base_url, max_retries=0))
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+@pytest.mark.parametrize("concurrency", [1, 3])
+def test_deliberate_batch_against_stub(stub, monkeypatch, concurrency):
+    waits, charged = [], []
+    retry_after, acquire = gb._retry_after, gb.TokenBudget.acquire
+    monkeypatch.setattr(gb, "_retry_after", lambda e, a: waits.append(retry_after(e, a)) or waits[-1])
+    monkeypatch.setattr(gb.TokenBudget, "acquire", lambda self, n: charged.append(n) or acquire(self, n))
+    items = [({"project": i}, []) for i in range(6)]
+
+    results = gb.deliberate_batch(items, concurrency=concurrency, tpm=1_000_000)
+
+    # orden de entrada, sea cual sea el orden en que terminan
+    assert [r["echo"] for r in results] == [f"DATO: {json.dumps(d)}" for d, _ in items]
+    assert all(r["compliance_check"] == "CUMPLE" for r in results)
+    # 6 respuestas + los 429 de las llamadas 3 y 6, cada uno esperando lo que pide Retry-After
+    assert openai_stub.State.calls == 8
+    assert waits == [0.05, 0.05]
+    # cada intento, también los reintentos, se descuenta del presupuesto TPM
+    assert len(charged) == 8
+    assert sorted(set(charged)) == sorted({gb.estimate_tokens(gb.build_prompt(d, c)) for d, c in items})
+
+def test_retry_after_header_is_capped():
+    class Err:
+        response = type("Response", (), {"headers": {"retry-after": "86400"}})()
+    assert gb._retry_after(Err(), 0) == gb.MAX_RETRY_WAIT
@@ -0,0 +1,113 @@
+import functools, json, math, random
+
+import pytest
+from rdflib import Graph
+
+import graph_cache
+import shacl_validate as sv
+
+# Valores adversariales: números como texto, bools, fechas inválidas, negativos,
+# decimales, notación científica y NaN/inf (válidos para JSON Schema "number").
+VALUES = ["abc", "12", "1.5", "-2", "2024-01-31", "2024-13-01", "2024-01", "0", "1e5", "",
+          12, 0, -3, 1.5, -0.5, 1e-7, 10**20, True, False]
+NON_FINITE = [math.nan, math.inf, -math.inf]
+
+@pytest.fixture(autouse=True)
+def no_graph_cache(monkeypatch, repo_root):
+    # sin caché en disco de grafos parseados: el test no escribe en ontology/
+    monkeypatch.setattr(sv, "load_graph", functools.partial(graph_cache.load_graph, cache_dir=None))
+    sv._ontology_graph.cache_clear()
+    sv._shapes_graph.cache_clear()
+
+def _record(rng, fields, values, p_missing=0.15):
+    return {k: rng.choice(values) for k in fields if rng.random() >= p_missing}
+
+def _write_inputs(tmp_path, records_by_std):
+    inputs = {}
+    for std, records in records_by_std.items():
+        p = tmp_path / f"{std.lower()}_2024-01.json"
+        p.write_text(json.dumps(records), encoding="utf-8")
+        inputs[std] = [p]
+    return inputs
+
+def _reference(inputs):
+    g = Graph()
+    g += sv._ontology_graph()
+    for std, paths in inputs.items():
+        for p in paths:
+            sv.materialize(g, p, std)
+    return sv.run_shacl_combined(g, sv.SHAPES)
+
+def _native(inputs):
+    return sv.run_shacl_native(inputs, sv.SHAPES, sv._ontology_graph())
+
+@pytest.mark.parametrize("seed", range(4))
+def test_native_matches_pyshacl_on_random_records(tmp_path, seed):
+    rng = random.Random(seed)
+    records = {std: [_record(rng, [f[0] for f in spec["fields"]], VALUES) for _ in range(40)]
+               for std, spec in sv.RECORD_SPECS.items()}
+    inputs = _write_inputs(tmp_path, records)
+    native, reference = _native(inputs), _reference(inputs)
+    for std in sv.SHAPES:
+        assert native[std] is not None, std
+        assert native[std] == reference[std], std
+
+def test_native_matches_pyshacl_on_edge_records(tmp_path):
+    records = {
+        "E1": [{}, {"company_id": "A"},
+               {"company_id": "A", "period_start": "2024-01-01", "period_end": "2024-01-31", "kwh": 0},
+               {"company_id": 1, "period_start": "2024-02-30", "period_end": True, "kwh": "5"},
+               {"company_id": "A", "period_start": "2024-01-01", "period_end": "2024-01-31", "kwh": -0.0}],
+        "S1": [{"company_id": "A", "period": "2024-01", "employees_start": 1.0, "employees_end": False, "exits": "3"},
+               {"period": "2024-1", "employees_start": -1}],
+        "G1": [{"company_id": "A", "period": "2024-01x", "cases_opened": 10**30, "cases_closed": 0,
+                "closed_with_resolution": True}],
+    }
+    inputs = _write_inputs(tmp_path, records)
+    native, reference = _native(inputs), _reference(inputs)
+    for std in sv.SHAPES:
+        assert native[std] == reference[std], std
+
+@pytest.mark.parametrize("value", NON_FINITE, ids=["nan", "inf", "-inf"])
+def test_non_finite_numbers_fall_back_to_pyshacl(tmp_path, value):
+    records = {"E1": [{"company_id": "A", "period_start": "2024-01-01", "period_end": "2024-01-31", "kwh": value}],
+               "S1": [{"company_id": "A", "period": "2024-01", "employees_start": 1, "employees_end": 1, "exits": 0}],
+               "G1": []}
+    inputs = _write_inputs(tmp_path, records)
+    native = _native(inputs)
+    assert native["E1"] is None  # NaN/inf no es una clave ausente: lo decide pyshacl
+    assert native["S1"] == _reference(inputs)["S1"]
+
+def test_explicit_null_falls_back_to_pyshacl(tmp_path):
+    inputs = _write_inputs(tmp_path, {"E1": [{"company_id": None}], "S1": [], "G1": []})
+    assert _native(inputs)["E1"] is None
+
+def test_files_of_the_same_standard_do_not_collide(tmp_path):
+    # dos periodos/filiales de S1: cada fichero tiene su base de sujetos
+    bad = {"company_id": "A", "period": "2024-01", "employees_start": -1, "employees_end": 1, "exits": 0}
+    inputs = _write_inputs(tmp_path, {"E1": [], "S1": [bad], "G1": []})
+    second = tmp_path / "s1_2024-02.json"
+    second.write_text(json.dumps([dict(bad, period="2024-02")]), encoding="utf-8")
+    inputs["S1"].append(second)
+    native, reference = _native(inputs), _reference(inputs)
+    assert native["S1"] == reference["S1"]
+    assert native["S1"][1].count("Focus Node") == 2
+    assert "S1Record/s1_2024-02/1>" in native["S1"][1]
+
+def test_every_mode_writes_the_same_report(tmp_path):
+    # informe de pyshacl por estándar, combinado y nativo: "Source Shape" e IRI completa del
+    # componente en todos, y los mensajes con los prefijos del grafo de shapes
+    records = {"E1": [{"company_id": "A", "period_start": "2024-01-01", "kwh": -1}],
+               "S1": [{"company_id": "A", "period": "2024-1", "employees_start": 1, "employees_end": 1}],
+               "G1": []}
+    inputs = _write_inputs(tmp_path, records)
+    g = Graph()
+    g += sv._ontology_graph()
+    for std, paths in inputs.items():
+        for p in paths:
+            sv.materialize(g, p, std)
+    per_standard = {std: sv.run_shacl(g, path, f"SHACL {std}") for std, path in sv.SHAPES.items()}
+    assert per_standard == _reference(inputs) == _native(inputs)
+    text = per_standard["E1"][1]
+    assert "\tSource Shape: [ sh:" in text
+    assert "Constraint Violation in MinCountConstraintComponent (http://www.w3.org/ns/shacl#MinCountConstraintComponent):" in text
@@ -0,0 +1,33 @@
+import pytest
+from lxml import etree
+
+import xbrl_generate as xg
+
+def _values(path):
+    tree = etree.parse(str(path))
+    return [(v.text, v.get(f"{{{xg.XSI}}}nil")) for v in tree.iter(xg._q("Value"))]
+
+def test_null_facts_are_written_as_nil(repo_root, tmp_path):
+    out = tmp_path / "r.xbrl"
+    assert xg.write_report(out, [("a", None), ("b", float("nan"), "t"), ("c", 0, "t")], "ACME", "2024-01") == 3
+    assert "None" not in out.read_text(encoding="utf-8") and "nan" not in out.read_text(encoding="utf-8")
+    assert _values(out) == [(None, "true"), (None, "true"), ("0", None)]
+    assert xg.validate_file(out) == (True, None)
+
+def test_batch_reports_null_facts_as_nil(repo_root, tmp_path):
+    results = xg.generate_batch({"ACME": {"2024-01": {"k": None, "j": 2}}}, tmp_path)
+    assert [r["ok"] for r in results] == [True]
+    assert _values(results[0]["path"]) == [(None, "true"), ("2", None)]
+
+def test_consolidated_scope_comes_from_the_data():
+    assert xg.report_scope({"ACME": {"2024-01": {}}}) == ("ACME", "2024-01")
+    assert xg.report_scope({"BETA": {"2024-02": {}}, "ACME": {"2024-01": {}, "2024-03": {}}}) \
+        == ("ACME+BETA", "2024-01/2024-03")
+
+def test_sanitized_report_names_do_not_collide(tmp_path):
+    assert xg.report_path(tmp_path, "ACME", "2024-01") == tmp_path / "ACME_2024-01.xbrl"
+    assert xg.report_path(tmp_path, "A/B", "2024-01") != xg.report_path(tmp_path, "A_B", "2024-01")
+
+def test_batch_rejects_duplicate_report_paths(repo_root, tmp_path):
+    with pytest.raises(ValueError, match="mismo informe"):
+        xg.generate_batch({"A_1": {"B": {"k": 1}}, "A": {"1_B": {"k": 1}}}, tmp_path)